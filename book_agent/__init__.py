@@ -5,6 +5,18 @@ Package that contains the root ADK agent for the Kindle book generator.
 For now this just exposes `root_agent`. You will later add:
 - tools (quote search, GCS upload, etc.)
 - sub-agents or more advanced orchestration.
+
+`root_agent` is resolved on first access (PEP 562), so importing a
+submodule (workflow, batch, worker, job_queue, ...) does not build the
+ADK pipeline in agent.py. Agents themselves are built on first use by the
+registry in custom_agents.py. Compare cold import times with:
+    python -m book_agent.benchmarks.import_time
 """
-from .agent import root_agent  # noqa: F401
 
+
+def __getattr__(name: str):
+    if name == "root_agent":
+        from .agent import root_agent
+
+        return root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
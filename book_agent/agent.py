@@ -2,70 +2,451 @@
 """
 Parallel-only Kindle book workflow.
 Runs:
-1. outline_agent_parallel  (cloned outline agent)
-2. chapter_parallel_agent  (ParallelAgent running cloned chapter writer agents)
+1. outline_agent_parallel  (cloned outline agent, stores its JSON in state)
+2. chapter_parallel_agent  (runs ONE chapter writer per outline chapter,
+                            all at the same time)
+
+Every agent invocation holds a slot of the shared AdaptiveRateLimiter
+(rate_limiter.py), retrying rate-limit errors with its backoff, and every
+model request waits for the RPM/TPM budget.
+
+The number of chapter writers is decided at run time from the outline,
+so an 18-chapter outline gets 18 writers and a 5-chapter outline gets 5.
+Writers are borrowed from a cached pool keyed by chapter number.
+
+By default writers run with scoped context: each one sees only an input
+message with the book spec and ITS OWN outline entry (posted on its
+branch), not the whole conversation, so per-chapter prompt size stays flat
+as books grow. BOOK_BOT_SCOPED_WRITERS=0 restores full-history writers.
+
+If a ModelRouter is configured (model_routing.py), the outline and each
+chapter writer run on the model routed for their step and chapter.
+
+Every agent step is recorded in a tracing.RunTrace (the active one if the
+caller set it, otherwise one per invocation). When the pipeline finishes,
+the trace is written to session state["run_trace"] and, if
+BOOK_BOT_TRACE_DIR is set, to <dir>/<invocation_id>.json.
 """
 
-from google.adk.agents import SequentialAgent, ParallelAgent
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncGenerator, Dict, List, Tuple
+
+from google.adk.agents import BaseAgent, SequentialAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types
+
 from .custom_agents import (
     outline_agent,
-    chapter_writer_agents,
+    build_chapter_writer_agent,
 )
+from .json_utils import parse_json_object
+from .model_routing import get_model_router
+from .rate_limiter import get_rate_limiter, is_rate_limit_error
+from .tracing import RunTrace, get_current_trace
+from .validation import _as_int
+
+logger = logging.getLogger(__name__)
+
+# Session state key that outline_agent_parallel writes its raw output to.
+OUTLINE_STATE_KEY = "outline"
+
+# Session state key the finished pipeline writes its run trace to.
+RUN_TRACE_STATE_KEY = "run_trace"
+
+# Writers see only the spec + their own outline entry (see module docstring).
+SCOPED_WRITERS = os.environ.get("BOOK_BOT_SCOPED_WRITERS", "1") != "0"
 
 
 # ------------------------------------------------------------
 # Helper to clone agents (avoid parent-agent conflicts)
 # ------------------------------------------------------------
 
-def clone_agent(agent, new_name: str):
+def clone_agent(agent, new_name: str, **overrides):
     return type(agent)(
         name=new_name,
         model=agent.model,
         description=agent.description,
         instruction=agent.instruction,
         tools=agent.tools.copy() if agent.tools else [],
-        sub_agents=[]
+        sub_agents=[],
+        before_model_callback=agent.before_model_callback,
+        after_model_callback=agent.after_model_callback,
+        **overrides,
     )
 
 
+# invocation_id -> trace, for pipeline runs without an active RunTrace.
+_invocation_traces: Dict[str, RunTrace] = {}
+
+
+def _trace_for(ctx: InvocationContext) -> RunTrace:
+    trace = get_current_trace()
+    if trace is None:
+        trace = _invocation_traces.get(ctx.invocation_id)
+        if trace is None:
+            trace = RunTrace(run_id=ctx.invocation_id)
+            _invocation_traces[ctx.invocation_id] = trace
+    return trace
+
+
+async def _run_in_rate_limit_slot(
+    agent: BaseAgent,
+    ctx: InvocationContext,
+    route_step: str | None = None,
+    route_chapter: dict | None = None,
+) -> AsyncGenerator[Event, None]:
+    """
+    Run `agent` while holding one slot of the shared rate limiter, and
+    record it as one step of the run trace.
+
+    With a configured ModelRouter and a `route_step`, the agent runs on
+    the routed model and the choice is recorded on the trace step. The
+    model is chosen again for each attempt, with the time already spent
+    on the step, so retries can fall back within the latency budget.
+
+    Rate-limit errors are retried like AdaptiveRateLimiter.run(): up to
+    max_retries times, with the same backoff. A retried agent resumes on
+    its branch, seeing the events its earlier attempt already produced.
+    """
+    router = get_model_router() if route_step else None
+    limiter = get_rate_limiter()
+    with _trace_for(ctx).step(agent.name, kind="agent", branch=ctx.branch) as step:
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            route = (
+                router.choose(route_step, route_chapter, time.perf_counter() - started)
+                if router
+                else None
+            )
+            routed = router.route_agent(agent, route["model"]) if route else agent
+            if route:
+                step.attrs["model"] = route["model"]
+                step.attrs["route_reason"] = route["reason"]
+            attempt_started = time.perf_counter()
+            try:
+                async with limiter.slot():
+                    async for event in routed.run_async(ctx):
+                        step.on_event(event)
+                        yield event
+                break
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= limiter.max_retries:
+                    raise
+                attempt += 1
+                limiter.stats["retries"] += 1
+                step.attrs["retries"] = attempt
+                await asyncio.sleep(limiter.retry_delay(attempt))
+        if route:
+            router.record_latency(
+                route_step, route["model"], time.perf_counter() - attempt_started
+            )
+
+
+class RateLimitedAgent(BaseAgent):
+    """
+    Runs its single sub-agent inside a shared rate-limiter slot (on the
+    model routed for `route_step`, if set).
+    """
+
+    route_step: str | None = None
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        async for event in _run_in_rate_limit_slot(
+            self.sub_agents[0], ctx, route_step=self.route_step
+        ):
+            yield event
+
+
 # ------------------------------------------------------------
 # Clone outline agent for exclusive use in the parallel workflow
 # ------------------------------------------------------------
 
-outline_agent_parallel = clone_agent(outline_agent, "outline_agent_parallel")
+outline_agent_parallel = clone_agent(
+    outline_agent,
+    "outline_agent_parallel",
+    output_key=OUTLINE_STATE_KEY,
+)
 
 
 # ------------------------------------------------------------
-# Clone chapter writer agents for parallel run
+# Chapter writer pool (built on demand, reused across runs)
 # ------------------------------------------------------------
 
-chapter_writers_parallel = [
-    clone_agent(agent, f"{agent.name}_parallel")
-    for agent in chapter_writer_agents
-]
+_chapter_writer_pool: Dict[Tuple[int, bool], BaseAgent] = {}
+
+
+def get_chapter_writers(
+    chapter_numbers: List[int], scoped: bool = False
+) -> List[BaseAgent]:
+    """
+    Return one `chapter_writer_N_parallel` agent per chapter number,
+    building any that are not yet in the pool.
+    """
+    writers = []
+    for number in chapter_numbers:
+        writer = _chapter_writer_pool.get((number, scoped))
+        if writer is None:
+            writer = build_chapter_writer_agent(
+                number, name=f"chapter_writer_{number}_parallel", scoped=scoped
+            )
+            _chapter_writer_pool[(number, scoped)] = writer
+        writers.append(writer)
+    return writers
+
+
+def _chapter_number(chapter: Any) -> int | None:
+    """
+    An outline entry's chapter number as an int (numeric strings such as
+    "3" included), or None if it has no usable number.
+    """
+    return _as_int(chapter.get("number")) if isinstance(chapter, dict) else None
+
+
+def outline_chapter_numbers(outline: dict) -> List[int]:
+    """
+    Distinct chapter numbers from the outline, in outline order.
+
+    Entries without a usable number, and repeats of a number, get no
+    writer; they are logged so a short book is not a silent surprise.
+    """
+    numbers: List[int] = []
+    for chapter in outline.get("chapters") or []:
+        number = _chapter_number(chapter)
+        if number is None:
+            logger.warning("Outline chapter without a usable number skipped: %.200r", chapter)
+        elif number in numbers:
+            logger.warning("Duplicate outline chapter number %d skipped", number)
+        else:
+            numbers.append(number)
+    return numbers
+
+
+def _book_spec_from_user_content(ctx: InvocationContext) -> Any:
+    """
+    The original user message, as JSON if it parses, else as plain text.
+    """
+    content = ctx.user_content
+    text = "".join(
+        part.text for part in (content.parts if content else None) or [] if part.text
+    )
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def scoped_writer_input(
+    book_spec: Any, outline: dict, outline_chapter: dict
+) -> Dict[str, Any]:
+    """
+    Everything ONE scoped writer needs: the spec, the outline's chapter
+    titles and its own outline entry (the input CHAPTER_INSTRUCTION describes).
+    """
+    return {
+        "book_spec": book_spec,
+        "working_title": outline.get("working_title", ""),
+        "subtitle": outline.get("subtitle", ""),
+        "notes_for_writer": outline.get("notes_for_writer", ""),
+        "outline_titles": [
+            c.get("title", "") for c in outline.get("chapters") or [] if isinstance(c, dict)
+        ],
+        "chapter": outline_chapter,
+    }
+
+
+async def _merge_agent_runs(
+    agent_runs: List[AsyncGenerator[Event, None]],
+) -> AsyncGenerator[Event, None]:
+    """
+    Interleave events from several agent runs as they are produced.
+
+    Each run pauses after an event until the consumer has taken it back,
+    so the runner has appended it to the session before that agent's next
+    model request is built from the session.
+
+    If one run fails (or the consumer stops early), the others are
+    cancelled AND closed before this generator finishes, so their rate
+    limiter slots are released immediately rather than at garbage
+    collection.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def drain(run: AsyncGenerator[Event, None]) -> None:
+        try:
+            async for event in run:
+                resume = asyncio.Event()
+                await queue.put((event, resume))
+                await resume.wait()
+        except BaseException as e:  # surfaced to the consumer below
+            await queue.put(e)
+        finally:
+            # A run cancelled while paused at its yield is still open
+            # (holding its slot); close it here.
+            try:
+                await run.aclose()
+            finally:
+                await queue.put(done)
+
+    tasks = [asyncio.create_task(drain(run)) for run in agent_runs]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                event, resume = item
+                yield event
+                resume.set()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 # ------------------------------------------------------------
-# Parallel agent: runs all chapter writers at the same time
+# Parallel agent: one chapter writer per outline chapter
 # ------------------------------------------------------------
 
-chapter_parallel_agent = ParallelAgent(
+class DynamicChapterParallelAgent(BaseAgent):
+    """
+    Runs exactly as many chapter writers as the outline has chapters.
+
+    Reads the outline JSON from session state (written by
+    outline_agent_parallel via output_key), borrows one writer per chapter
+    from the pool and runs them concurrently on isolated branches.
+
+    With scoped_context, an input message for each writer (book spec +
+    its own outline entry) is posted on the writer's branch first, and the
+    writer ignores all other history.
+    """
+
+    outline_state_key: str = OUTLINE_STATE_KEY
+    scoped_context: bool = SCOPED_WRITERS
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        raw_outline = ctx.session.state.get(self.outline_state_key)
+        if not raw_outline:
+            raise RuntimeError(
+                f"{self.name}: no outline found in state[{self.outline_state_key!r}]"
+            )
+        if isinstance(raw_outline, str):
+            outline = parse_json_object(raw_outline, "outline_agent_parallel")
+        else:
+            outline = raw_outline
+
+        numbers = outline_chapter_numbers(outline)
+        writers = get_chapter_writers(numbers, scoped=self.scoped_context)
+        if not writers:
+            raise RuntimeError(f"{self.name}: outline contains no chapters")
+
+        # Same numbering rules as outline_chapter_numbers (first entry wins);
+        # writers see the number as an int.
+        outline_entries: Dict[int, dict] = {}
+        for chapter in outline.get("chapters") or []:
+            number = _chapter_number(chapter)
+            if number is not None and number not in outline_entries:
+                outline_entries[number] = {**chapter, "number": number}
+        book_spec = _book_spec_from_user_content(ctx) if self.scoped_context else None
+
+        agent_runs = []
+        for number, writer in zip(numbers, writers):
+            branch_ctx = ctx.model_copy()
+            branch_suffix = f"{self.name}.{writer.name}"
+            branch_ctx.branch = (
+                f"{ctx.branch}.{branch_suffix}" if ctx.branch else branch_suffix
+            )
+            if self.scoped_context:
+                writer_input = scoped_writer_input(
+                    book_spec, outline, outline_entries[number]
+                )
+                # Only this writer's branch sees it; with include_contents
+                # "none" it is the writer's whole conversation.
+                yield Event(
+                    invocation_id=ctx.invocation_id,
+                    author=self.name,
+                    branch=branch_ctx.branch,
+                    content=types.Content(
+                        role="user",
+                        parts=[types.Part(text=json.dumps(writer_input))],
+                    ),
+                )
+            agent_runs.append(
+                _run_in_rate_limit_slot(
+                    writer,
+                    branch_ctx,
+                    route_step="chapter",
+                    route_chapter=outline_entries.get(number),
+                )
+            )
+
+        async for event in _merge_agent_runs(agent_runs):
+            yield event
+
+
+chapter_parallel_agent = DynamicChapterParallelAgent(
     name="chapter_parallel_agent",
-    description="Runs chapter writer agents in parallel.",
-    sub_agents=chapter_writers_parallel,
+    description="Runs one chapter writer per outline chapter in parallel.",
 )
 
 
+class TracedSequentialAgent(SequentialAgent):
+    """
+    SequentialAgent that publishes the run trace when its sub-agents finish.
+    """
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        trace = _trace_for(ctx)
+        try:
+            async for event in super()._run_async_impl(ctx):
+                yield event
+        finally:
+            trace.finish()
+            if _invocation_traces.get(ctx.invocation_id) is trace:
+                del _invocation_traces[ctx.invocation_id]
+            trace_dir = os.environ.get("BOOK_BOT_TRACE_DIR")
+            if trace_dir:
+                trace.write_json(os.path.join(trace_dir, f"{trace.run_id}.json"))
+
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={RUN_TRACE_STATE_KEY: trace.to_dict()}),
+        )
+
+
 # ------------------------------------------------------------
 # Build the entire workflow:
 # outline → (parallel) chapters
 # ------------------------------------------------------------
 
-parallel_book_demo_agent = SequentialAgent(
+parallel_book_demo_agent = TracedSequentialAgent(
     name="parallel_book_demo_agent",
     description="Parallel-only pipeline: outline → chapter writers.",
     sub_agents=[
-        outline_agent_parallel,
+        RateLimitedAgent(
+            name="outline_rate_limited",
+            description="Runs outline_agent_parallel under the shared rate limiter.",
+            sub_agents=[outline_agent_parallel],
+            route_step="outline",
+        ),
         chapter_parallel_agent,
     ],
 )
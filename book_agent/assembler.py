@@ -0,0 +1,91 @@
+# book_agent/assembler.py
+"""
+Local assembly of full_book_markdown from structured manuscript pieces.
+
+The model already returns every chapter's content_markdown; asking it to
+repeat all of that again as full_book_markdown doubles the output tokens of
+the most expensive step. Instead the book is assembled here, in order:
+
+  1. Title page (title + subtitle + author_name from book_spec)
+  2. Dedication
+  3. Introduction
+  4. ALL chapters in order of chapter.number
+
+write_book_markdown() streams each section into any text writer (an open
+file, a StringIO, an upload buffer), so no intermediate list of sections
+or extra full copy of the book is built.
+"""
+
+import io
+from typing import Any, Dict, List, TextIO
+
+SECTION_SEPARATOR = "\n\n"
+
+
+def _ordered_chapters(chapters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(chapters, key=lambda c: c.get("number") or 0)
+
+
+def write_book_markdown(
+    writer: TextIO,
+    book_spec: Dict[str, Any],
+    working_title: str,
+    subtitle: str,
+    front_matter_markdown: Dict[str, Any],
+    chapters: List[Dict[str, Any]],
+) -> None:
+    """
+    Stream the full book Markdown into `writer`, section by section.
+    """
+
+    front_matter_markdown = front_matter_markdown or {}
+
+    # 1) Title page
+    writer.write(f"# {working_title}")
+    if subtitle:
+        writer.write(f"{SECTION_SEPARATOR}## {subtitle}")
+    author_name = book_spec.get("author_name")
+    if author_name:
+        writer.write(f"{SECTION_SEPARATOR}_by {author_name}_")
+
+    # 2) Dedication
+    dedication = front_matter_markdown.get("dedication")
+    if dedication:
+        writer.write(f"{SECTION_SEPARATOR}## Dedication{SECTION_SEPARATOR}")
+        writer.write(dedication.strip())
+
+    # 3) Introduction
+    introduction = front_matter_markdown.get("introduction")
+    if introduction:
+        writer.write(f"{SECTION_SEPARATOR}## Introduction{SECTION_SEPARATOR}")
+        writer.write(introduction.strip())
+
+    # 4) Chapters, in number order
+    for chapter in _ordered_chapters(chapters):
+        writer.write(SECTION_SEPARATOR)
+        writer.write((chapter.get("content_markdown") or "").strip())
+
+    writer.write("\n")
+
+
+def assemble_book_markdown(
+    book_spec: Dict[str, Any],
+    working_title: str,
+    subtitle: str,
+    front_matter_markdown: Dict[str, Any],
+    chapters: List[Dict[str, Any]],
+) -> str:
+    """
+    Convenience wrapper returning the assembled book as one string.
+    """
+
+    buffer = io.StringIO()
+    write_book_markdown(
+        buffer,
+        book_spec=book_spec,
+        working_title=working_title,
+        subtitle=subtitle,
+        front_matter_markdown=front_matter_markdown,
+        chapters=chapters,
+    )
+    return buffer.getvalue()
@@ -0,0 +1,192 @@
+# book_agent/batch.py
+"""
+Batch book generation from a JSONL file of book specs.
+
+Each input line is either a bare book spec (same JSON as test_workflow.py)
+or an envelope {"id": "...", "book_spec": {...}}. Books are generated with
+generate_book_payload_async under a global concurrency cap, and one JSON
+line is appended to the output file as each book finishes:
+
+  {"id": "...", "status": "ok",    "latency_s": 123.4, "payload": {...}}
+  {"id": "...", "status": "error", "latency_s": 12.3,  "error": "..."}
+
+A summary (books/hour, per-book latency percentiles, and how often chapter
+hedges fired and won when hedging is on) is printed at the end.
+With --include-trace each ok record's payload also carries its per-step
+"run_trace" (see tracing.py). With --resume each book is checkpointed under
+the run ID "<input file name>-<id>" (see checkpoints.py), so re-running an
+interrupted batch skips the steps that already finished.
+
+Usage:
+    python -m book_agent.batch specs.jsonl results.jsonl --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .hedging import get_chapter_hedger
+from .storage_backends import get_storage_backend
+from .workflow import DEFAULT_CHAPTER_CONCURRENCY, generate_book_payload_async
+
+DEFAULT_BOOK_CONCURRENCY = 4
+
+
+def read_book_specs(
+    path: str,
+) -> Iterator[Tuple[str, Dict[str, Any] | ValueError]]:
+    """
+    Yield (id, book_spec) for every non-blank line of a JSONL file.
+
+    A malformed line yields (line number, ValueError) instead of raising,
+    so one bad line fails only its own book.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield str(line_no), ValueError(f"line {line_no}: invalid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield str(line_no), ValueError(f"line {line_no}: not a JSON object")
+                continue
+            if "book_spec" in record:
+                yield str(record.get("id", line_no)), record["book_spec"]
+            else:
+                yield str(line_no), record
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarise(latencies: List[float], failures: int, elapsed_s: float) -> Dict[str, Any]:
+    """
+    Throughput and latency summary for a finished batch.
+    """
+    completed = len(latencies)
+    return {
+        "books_ok": completed,
+        "books_failed": failures,
+        "elapsed_s": round(elapsed_s, 2),
+        "books_per_hour": round(completed / elapsed_s * 3600, 2) if elapsed_s else 0.0,
+        "latency_s": {
+            "p50": round(_percentile(latencies, 50), 2),
+            "p95": round(_percentile(latencies, 95), 2),
+            "max": round(max(latencies), 2) if latencies else 0.0,
+        },
+    }
+
+
+async def run_batch_async(
+    input_path: str,
+    output_path: str,
+    concurrency: int = DEFAULT_BOOK_CONCURRENCY,
+    chapter_concurrency: int = DEFAULT_CHAPTER_CONCURRENCY,
+    include_trace: bool = False,
+    resume: bool = False,
+) -> Dict[str, Any]:
+    """
+    Generate every book in `input_path`, streaming results to `output_path`.
+    """
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    write_lock = asyncio.Lock()
+    latencies: List[float] = []
+    failures = 0
+    started = time.perf_counter()
+    run_prefix = os.path.basename(input_path)
+
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        async def run_one(book_id: str, book_spec: Dict[str, Any] | ValueError) -> None:
+            nonlocal failures
+            try:
+                book_start = time.perf_counter()
+                try:
+                    if isinstance(book_spec, ValueError):
+                        raise book_spec
+                    payload = await generate_book_payload_async(
+                        book_spec,
+                        chapter_concurrency=chapter_concurrency,
+                        include_trace=include_trace,
+                        run_id=f"{run_prefix}-{book_id}" if resume else None,
+                    )
+                    record = {"id": book_id, "status": "ok", "payload": payload}
+                    latencies.append(time.perf_counter() - book_start)
+                except Exception as e:  # one bad book must not stop the batch
+                    record = {"id": book_id, "status": "error", "error": repr(e)}
+                    failures += 1
+                record["latency_s"] = round(time.perf_counter() - book_start, 3)
+
+                async with write_lock:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+            finally:
+                semaphore.release()
+
+        tasks = []
+        for book_id, book_spec in read_book_specs(input_path):
+            # Acquire before creating the task so specs are read lazily and
+            # at most `concurrency` books are in memory at once.
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run_one(book_id, book_spec)))
+        await asyncio.gather(*tasks)
+
+    # Local backends batch their fsyncs; make the last batch durable.
+    await asyncio.to_thread(get_storage_backend().flush)
+
+    summary = summarise(latencies, failures, time.perf_counter() - started)
+    hedger = get_chapter_hedger()
+    if hedger:
+        summary["hedging"] = dict(hedger.stats)
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate books from a JSONL of specs.")
+    parser.add_argument("input_path", help="JSONL file of book specs")
+    parser.add_argument("output_path", help="JSONL file to append results to")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_BOOK_CONCURRENCY)
+    parser.add_argument(
+        "--chapter-concurrency", type=int, default=DEFAULT_CHAPTER_CONCURRENCY
+    )
+    parser.add_argument(
+        "--include-trace",
+        action="store_true",
+        help="add each book's per-step run trace to its payload",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="checkpoint each book and skip steps finished by an earlier run",
+    )
+    args = parser.parse_args()
+
+    summary = asyncio.run(
+        run_batch_async(
+            args.input_path,
+            args.output_path,
+            concurrency=args.concurrency,
+            chapter_concurrency=args.chapter_concurrency,
+            include_trace=args.include_trace,
+            resume=args.resume,
+        )
+    )
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# book_agent/benchmarks/__init__.py
+"""
+Offline benchmarks for the book generator.
+
+Each module is runnable with `python -m book_agent.benchmarks.<name>` and
+needs no model or cloud credentials.
+"""
@@ -0,0 +1,297 @@
+# book_agent/benchmarks/fakes.py
+"""
+Deterministic stand-ins for Gemini and Cloud Storage.
+
+FakeLlm answers every agent in custom_agents.py with well-formed JSON of
+the right shape, with configurable:
+  - latency_s          time to first token
+  - tail_rate          share of requests that are `tail_factor` times slower
+  - tokens_per_second  output rate (streamed in chunks when SSE is on)
+  - failure_rate       share of requests failing with a 429-style error
+  - malformed_rate     share of JSON answers replaced by non-JSON text
+
+Agents offered the search_quotes tool call it once before answering, so
+the tool loop and the quote cache are exercised too.
+
+FakeStorageClient implements the small part of google.cloud.storage that
+storage_backends.GCSBackend uses and keeps uploads in memory.
+
+install_fakes() routes every model name to FakeLlm and installs a
+GCSBackend on the fake storage client. Install it before any agent has run: LlmAgent caches the model it
+resolves.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncGenerator, Dict, Iterator
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+from pydantic import Field, PrivateAttr
+
+from .. import storage_backends
+
+
+class FakeRateLimitError(Exception):
+    """
+    Injected failure that rate_limiter.is_rate_limit_error treats as a 429.
+    """
+
+    code = 429
+
+
+# Another agent's output relayed as user context, e.g.
+# "For context: [chapter_parallel_agent] said: {...}"; newer ADK versions
+# put the preamble in its own part and fence the quoted text with markers.
+_RELAYED_TEXT = re.compile(r"^(?:For context:\s*)?\[[^\]]+\] said:\s*")
+
+
+def _part_json(text: str) -> Any:
+    match = _RELAYED_TEXT.match(text)
+    if match:
+        # Drop the attribution and any fence markers around the JSON.
+        text = text[match.end():]
+        text = text[text.find("{"):text.rfind("}") + 1]
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def _user_json(llm_request: LlmRequest) -> Dict[str, Any]:
+    """
+    The most recent JSON object in a user turn (the agent's own input;
+    earlier ones are the user's book_spec and other agents' outputs).
+    """
+    found: Dict[str, Any] = {}
+    for content in llm_request.contents or []:
+        if content.role != "user":
+            continue
+        for part in content.parts or []:
+            if part.text:
+                value = _part_json(part.text)
+                if isinstance(value, dict):
+                    found = value
+    return found
+
+
+def _has_function_response(llm_request: LlmRequest) -> bool:
+    return any(
+        part.function_response is not None
+        for content in llm_request.contents or []
+        for part in content.parts or []
+    )
+
+
+class FakeLlm(BaseLlm):
+    """
+    Offline model that returns book-shaped JSON after a simulated delay.
+    """
+
+    latency_s: float = 0.5
+    tail_rate: float = 0.0
+    tail_factor: float = 3.0
+    tokens_per_second: float = 200.0
+    failure_rate: float = 0.0
+    malformed_rate: float = 0.0
+    outline_chapters: int = 8
+    chapter_words: int = 1500
+    seed: int = 0
+    stats: Dict[str, int] = Field(
+        default_factory=lambda: {"requests": 0, "failures": 0, "malformed": 0, "tool_calls": 0}
+    )
+
+    _rng: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    # -----------------------------------------------------------------
+    # Canned answers, chosen by the agent's instruction
+    # -----------------------------------------------------------------
+    def _chapter(self, number: int, title: str) -> Dict[str, Any]:
+        body = " ".join(["lorem"] * self.chapter_words)
+        return {
+            "number": number,
+            "title": title,
+            "subheading": f"Subheading {number}",
+            "quote": {"text": "Well begun is half done.", "author": "Aristotle"},
+            "summary": f"Summary of chapter {number}.",
+            "content_markdown": f"# {title}\n\n{body}",
+        }
+
+    def _answer(self, instruction: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        if instruction.startswith("You run ONE web search"):
+            return {
+                "query": data.get("query", ""),
+                "results": [
+                    {"title": "Quotes", "snippet": "Well begun is half done.", "url": "https://example.com"}
+                ],
+            }
+        if instruction.startswith("You generate a structured chapter outline"):
+            return {
+                "working_title": "Benchmark Book",
+                "subtitle": "A Synthetic Subtitle",
+                "chapters": [
+                    {"number": i, "title": f"Chapter {i}", "subheading": f"Part {i}"}
+                    for i in range(1, self.outline_chapters + 1)
+                ],
+                "notes_for_writer": "Keep it practical.",
+            }
+        if instruction.startswith("You extend an existing"):
+            start = len(data.get("existing_chapters") or []) + 1
+            return {
+                "chapters": [
+                    {"number": n, "title": f"Extra chapter {n}", "subheading": ""}
+                    for n in range(start, start + int(data.get("chapters_needed") or 0))
+                ]
+            }
+        if instruction.startswith("You write the front matter"):
+            return {
+                "working_title": "Benchmark Book",
+                "subtitle": "A Synthetic Subtitle",
+                "blurb": "A blurb.",
+                "front_matter_markdown": {"dedication": "For you.", "introduction": "Hello."},
+            }
+        if instruction.startswith("You write ONE chapter"):
+            chapter = data.get("chapter") or {}
+            number = chapter.get("number", 1)
+            return self._chapter(number, chapter.get("title") or f"Chapter {number}")
+        match = re.search(r"Chapter Writer Agent for chapter number (\d+)", instruction)
+        if match:
+            number = int(match.group(1))
+            return {"chapter_number": number, "used": True, **self._chapter(number, f"Chapter {number}")}
+        return {"ok": True}
+
+    # -----------------------------------------------------------------
+    # BaseLlm
+    # -----------------------------------------------------------------
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self.stats["requests"] += 1
+        slow = self._rng.random() < self.tail_rate
+        await asyncio.sleep(self.latency_s * (self.tail_factor if slow else 1.0))
+
+        if self._rng.random() < self.failure_rate:
+            self.stats["failures"] += 1
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED (injected)")
+
+        data = _user_json(llm_request)
+        if "search_quotes" in llm_request.tools_dict and not _has_function_response(llm_request):
+            self.stats["tool_calls"] += 1
+            yield LlmResponse(
+                content=types.Content(
+                    role="model",
+                    parts=[
+                        types.Part(
+                            function_call=types.FunctionCall(
+                                name="search_quotes",
+                                args={"query": "benchmark inspirational quote"},
+                            )
+                        )
+                    ],
+                ),
+                usage_metadata=types.GenerateContentResponseUsageMetadata(
+                    prompt_token_count=len(json.dumps(data)) // 4,
+                    candidates_token_count=10,
+                    total_token_count=len(json.dumps(data)) // 4 + 10,
+                ),
+            )
+            return
+
+        instruction = str(llm_request.config.system_instruction or "").strip()
+        text = json.dumps(self._answer(instruction, data), ensure_ascii=False)
+        if self._rng.random() < self.malformed_rate:
+            self.stats["malformed"] += 1
+            text = "Sorry, I cannot produce JSON right now."
+
+        output_tokens = max(1, len(text) // 4)
+        generation_s = output_tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+        if slow:
+            generation_s *= self.tail_factor
+        if stream:
+            chunks = max(1, min(20, output_tokens // 50))
+            size = -(-len(text) // chunks)
+            for i in range(0, len(text), size):
+                await asyncio.sleep(generation_s / chunks)
+                yield LlmResponse(
+                    content=types.Content(role="model", parts=[types.Part(text=text[i:i + size])]),
+                    partial=True,
+                )
+        else:
+            await asyncio.sleep(generation_s)
+
+        prompt_tokens = len(json.dumps(data)) // 4
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=output_tokens,
+                total_token_count=prompt_tokens + output_tokens,
+            ),
+        )
+
+
+# ---------------------------------------------------------------------
+# Fake Cloud Storage
+# ---------------------------------------------------------------------
+
+class _FakeBlob:
+    def __init__(self, client: "FakeStorageClient", bucket: str, name: str):
+        self._client = client
+        self._key = f"{bucket}/{name}"
+
+    def upload_from_string(self, data: Any, content_type: str | None = None, **kwargs: Any) -> None:
+        if self._client.upload_latency_s:
+            time.sleep(self._client.upload_latency_s)
+        self._client.objects[self._key] = data
+
+
+class _FakeBucket:
+    def __init__(self, client: "FakeStorageClient", name: str):
+        self._client = client
+        self.name = name
+
+    def blob(self, name: str) -> _FakeBlob:
+        return _FakeBlob(self._client, self.name, name)
+
+
+class FakeStorageClient:
+    """
+    In-memory replacement for google.cloud.storage.Client.
+    """
+
+    def __init__(self, upload_latency_s: float = 0.0):
+        self.upload_latency_s = upload_latency_s
+        self.objects: Dict[str, Any] = {}
+
+    def bucket(self, name: str) -> _FakeBucket:
+        return _FakeBucket(self, name)
+
+
+@contextmanager
+def install_fakes(
+    llm: FakeLlm, storage_client: FakeStorageClient
+) -> Iterator[None]:
+    """
+    Route every model name to `llm` and storage calls to `storage_client`.
+    """
+    original_new_llm = LLMRegistry.__dict__["new_llm"]
+    original_backend = storage_backends._backend
+    LLMRegistry.new_llm = staticmethod(lambda model: llm)
+    storage_backends.set_storage_backend(
+        storage_backends.GCSBackend(client=storage_client)
+    )
+    try:
+        yield
+    finally:
+        LLMRegistry.new_llm = original_new_llm
+        storage_backends._backend = original_backend
@@ -0,0 +1,85 @@
+# book_agent/benchmarks/import_time.py
+"""
+Measure cold import time of the package's entry points.
+
+Each module is imported in a fresh interpreter `--runs` times (nothing
+cached in sys.modules, bytecode already compiled); the median wall time is
+reported along with what the import dragged in:
+  - agents_built:        agents built by the custom_agents registry
+  - agent_py_loaded:     whether the ADK pipeline in agent.py was built
+  - gcs_client_loaded:   whether google.cloud.storage was imported
+
+Usage:
+    python -m book_agent.benchmarks.import_time --runs 5
+    python -m book_agent.benchmarks.import_time book_agent.worker
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+DEFAULT_MODULES = [
+    "book_agent",
+    "book_agent.job_queue",
+    "book_agent.workflow",
+    "book_agent.batch",
+    "book_agent.worker",
+    "book_agent.agent",
+]
+
+# Runs in the child interpreter; prints one JSON line.
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+agents = sys.modules.get("book_agent.custom_agents")
+print(json.dumps({{
+    "import_s": elapsed,
+    "agents_built": sorted(getattr(agents, "_agents", {{}})),
+    "agent_py_loaded": "book_agent.agent" in sys.modules,
+    "gcs_client_loaded": "google.cloud.storage" in sys.modules,
+}}))
+"""
+
+
+def _probe(module: str) -> Dict[str, Any]:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure(module: str, runs: int) -> Dict[str, Any]:
+    _probe(module)  # warm the bytecode and OS file caches
+    samples = [_probe(module) for _ in range(max(1, runs))]
+    times = [s["import_s"] for s in samples]
+    last = samples[-1]
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(times) * 1000, 1),
+        "min_ms": round(min(times) * 1000, 1),
+        "agents_built": last["agents_built"],
+        "agent_py_loaded": last["agent_py_loaded"],
+        "gcs_client_loaded": last["gcs_client_loaded"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results: List[Dict[str, Any]] = [measure(m, args.runs) for m in args.modules]
+    print(json.dumps({"runs": args.runs, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
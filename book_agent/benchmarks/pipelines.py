@@ -0,0 +1,234 @@
+# book_agent/benchmarks/pipelines.py
+"""
+Compare the workflow.py pipeline with the agent.py ParallelAgent pipeline
+offline, using FakeLlm and FakeStorageClient (see fakes.py).
+
+Drives N books through each pipeline with at most C in flight and reports
+per-book latency percentiles (p50/p95/p99), throughput and peak RSS.
+
+--tail-rate makes a share of model requests --tail-factor times slower;
+with --hedge-percentile the workflow pipeline hedges slow chapters (see
+hedging.py) and its results include how often hedges fired and won.
+
+Usage:
+    python -m book_agent.benchmarks.pipelines --books 20 --concurrency 4 \
+        --latency 0.2 --tokens-per-second 1000 --failure-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from google.adk.runners import InMemoryRunner
+from google.genai import types
+
+from .. import workflow
+from ..hedging import RequestHedger, get_chapter_hedger, set_chapter_hedger
+from ..agent import root_agent
+from ..batch import _percentile
+from ..llm_cache import set_default_cache
+from ..quote_search import QuoteSearchCache, set_quote_cache
+from ..rate_limiter import AdaptiveRateLimiter, set_rate_limiter
+from .fakes import FakeLlm, FakeStorageClient, install_fakes
+
+PIPELINES = ("workflow", "parallel")
+
+BENCH_BOOK_SPEC = {
+    "author_name": "Bench Author",
+    "topic": "Leadership under pressure",
+    "target_audience": "New managers",
+    "author_voice_style": "Warm, direct",
+    "min_chapters": 3,
+}
+
+
+def _current_rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * resource.getpagesize()
+
+
+async def _sample_peak_rss(peak: List[int], interval_s: float = 0.05) -> None:
+    while True:
+        rss = _current_rss_bytes()
+        if rss is not None and rss > peak[0]:
+            peak[0] = rss
+        await asyncio.sleep(interval_s)
+
+
+async def _run_workflow_book(book_spec: Dict[str, Any], chapter_concurrency: int) -> None:
+    await workflow.generate_book_payload_async(
+        book_spec, chapter_concurrency=chapter_concurrency
+    )
+
+
+async def _run_parallel_book(book_spec: Dict[str, Any], chapter_concurrency: int) -> None:
+    runner = InMemoryRunner(agent=root_agent, app_name=workflow.APP_NAME)
+    session = await runner.session_service.create_session(
+        app_name=workflow.APP_NAME, user_id="bench-user"
+    )
+    async for _ in runner.run_async(
+        user_id="bench-user",
+        session_id=session.id,
+        new_message=types.Content(
+            role="user", parts=[types.Part(text=json.dumps(book_spec))]
+        ),
+    ):
+        pass
+
+
+async def _drive(
+    run_book: Callable[[Dict[str, Any], int], Awaitable[None]],
+    books: int,
+    concurrency: int,
+    chapter_concurrency: int,
+) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    latencies: List[float] = []
+    failures: List[str] = []
+
+    async def one() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await run_book(dict(BENCH_BOOK_SPEC), chapter_concurrency)
+            except Exception as e:  # recorded, not fatal to the benchmark
+                failures.append(repr(e))
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    peak = [_current_rss_bytes() or 0]
+    sampler = asyncio.create_task(_sample_peak_rss(peak))
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(one() for _ in range(books)))
+    finally:
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+
+    return {
+        "books_ok": len(latencies),
+        "books_failed": len(failures),
+        "first_error": failures[0] if failures else None,
+        "elapsed_s": round(elapsed, 3),
+        "books_per_hour": round(len(latencies) / elapsed * 3600, 1) if elapsed else 0.0,
+        "latency_s": {
+            "p50": round(_percentile(latencies, 50), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+        },
+        "peak_rss_mb": round(peak[0] / 2**20, 1),
+    }
+
+
+def _reset_shared_state(hedge_percentile: float | None) -> None:
+    # Fresh caches, limiter and hedger per pipeline so neither run helps
+    # the other.
+    set_chapter_hedger(
+        RequestHedger(percentile=hedge_percentile)
+        if hedge_percentile is not None
+        else None
+    )
+    set_default_cache(None)
+    set_quote_cache(QuoteSearchCache())
+    set_rate_limiter(
+        AdaptiveRateLimiter(
+            requests_per_minute=1_000_000,
+            tokens_per_minute=1_000_000_000,
+            base_backoff_s=0.05,
+        )
+    )
+
+
+async def run_benchmark(
+    llm: FakeLlm,
+    storage_client: FakeStorageClient,
+    pipelines: List[str],
+    books: int,
+    concurrency: int,
+    chapter_concurrency: int,
+    hedge_percentile: float | None = None,
+) -> Dict[str, Any]:
+    runners = {"workflow": _run_workflow_book, "parallel": _run_parallel_book}
+    results: Dict[str, Any] = {}
+    with install_fakes(llm, storage_client):
+        for name in pipelines:
+            _reset_shared_state(hedge_percentile)
+            requests_before = llm.stats["requests"]
+            results[name] = await _drive(
+                runners[name], books, concurrency, chapter_concurrency
+            )
+            results[name]["model_requests"] = llm.stats["requests"] - requests_before
+            hedger = get_chapter_hedger()
+            if hedger and name == "workflow":
+                results[name]["hedging"] = dict(hedger.stats)
+        set_chapter_hedger(None)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pipeline", choices=PIPELINES + ("both",), default="both")
+    parser.add_argument("--books", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--chapter-concurrency", type=int, default=workflow.DEFAULT_CHAPTER_CONCURRENCY
+    )
+    parser.add_argument("--chapters", type=int, default=8)
+    parser.add_argument("--chapter-words", type=int, default=600)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=1000.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0)
+    parser.add_argument("--tail-factor", type=float, default=3.0)
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=None,
+        help="hedge workflow chapters slower than this latency percentile",
+    )
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--upload-latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    llm = FakeLlm(
+        # google_search only attaches to models named gemini-*.
+        model="gemini-2.5-flash",
+        latency_s=args.latency,
+        tail_rate=args.tail_rate,
+        tail_factor=args.tail_factor,
+        tokens_per_second=args.tokens_per_second,
+        failure_rate=args.failure_rate,
+        malformed_rate=args.malformed_rate,
+        outline_chapters=args.chapters,
+        chapter_words=args.chapter_words,
+        seed=args.seed,
+    )
+    pipelines = list(PIPELINES) if args.pipeline == "both" else [args.pipeline]
+    results = asyncio.run(
+        run_benchmark(
+            llm,
+            FakeStorageClient(upload_latency_s=args.upload_latency),
+            pipelines,
+            books=args.books,
+            concurrency=args.concurrency,
+            chapter_concurrency=args.chapter_concurrency,
+            hedge_percentile=args.hedge_percentile,
+        )
+    )
+    results["config"] = vars(args)
+    results["process_max_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
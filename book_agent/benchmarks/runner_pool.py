@@ -0,0 +1,96 @@
+# book_agent/benchmarks/runner_pool.py
+"""
+Measure the per-call overhead removed by RunnerPool.
+
+Runs many short agent calls through workflow._run_json_agent_async using a
+trivial local agent (no model call), once with a fresh pool per call (the
+old "new InMemoryRunner every step" behaviour) and once with a shared pool.
+
+Usage:
+    python -m book_agent.benchmarks.runner_pool --calls 500 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import AsyncGenerator
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.genai import types
+
+from .. import workflow
+from ..runner_pool import RunnerPool
+
+
+class EchoAgent(BaseAgent):
+    """
+    Replies with a fixed JSON object immediately, without calling a model.
+    """
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            content=types.Content(
+                role="model", parts=[types.Part(text='{"ok": true}')]
+            ),
+        )
+
+
+async def _run_calls(agent, calls: int, concurrency: int, pooled: bool) -> float:
+    shared_pool = RunnerPool(workflow.APP_NAME)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        pool = shared_pool if pooled else RunnerPool(workflow.APP_NAME)
+        async with semaphore:
+            await workflow._run_json_agent_async(
+                agent,
+                input_obj={"i": i},
+                user_id="bench-user",
+                session_id="bench-session",
+                runner_pool=pool,
+            )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return time.perf_counter() - start
+
+
+async def _run(calls: int, concurrency: int) -> dict:
+    agent = EchoAgent(name="echo_agent")
+
+    # Warm up imports / lazy initialisation before timing anything.
+    await _run_calls(agent, 10, concurrency, pooled=True)
+
+    fresh = await _run_calls(agent, calls, concurrency, pooled=False)
+    pooled = await _run_calls(agent, calls, concurrency, pooled=True)
+
+    return {
+        "calls": calls,
+        "concurrency": concurrency,
+        "fresh_runner_total_s": round(fresh, 4),
+        "pooled_runner_total_s": round(pooled, 4),
+        "fresh_runner_per_call_ms": round(fresh / calls * 1000, 3),
+        "pooled_runner_per_call_ms": round(pooled / calls * 1000, 3),
+        "overhead_removed_per_call_ms": round((fresh - pooled) / calls * 1000, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    result = asyncio.run(_run(args.calls, args.concurrency))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# book_agent/book_events.py
+"""
+Typed progress events yielded by workflow.generate_book_events_async.
+
+In order of arrival for one book:
+  OutlineReady      the validated outline (always first)
+  ChapterComplete   one per chapter, in COMPLETION order (not chapter order)
+  StorageDone       the storage tool's result (GCS / manifest URIs)
+  BookComplete      the final payload (always last)
+
+Events hold references to the workflow's own objects (the chapter dict
+in ChapterComplete is the one that ends up in the final payload), so
+streaming adds no copies. to_dict() gives a JSON-ready form with a "type"
+field, e.g. for server-sent events.
+"""
+
+from typing import Any, Dict
+
+
+class BookEvent:
+    """
+    Base class for streamed book events.
+    """
+
+    type = "event"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type}
+
+
+class OutlineReady(BookEvent):
+    type = "outline_ready"
+
+    def __init__(self, outline: Dict[str, Any]):
+        self.outline = outline
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "outline": self.outline}
+
+
+class ChapterComplete(BookEvent):
+    type = "chapter_complete"
+
+    def __init__(self, chapter: Dict[str, Any]):
+        self.chapter = chapter
+        self.number = chapter.get("number")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "number": self.number, "chapter": self.chapter}
+
+
+class StorageDone(BookEvent):
+    type = "storage_done"
+
+    def __init__(self, result: Dict[str, Any]):
+        self.result = result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "result": self.result}
+
+
+class BookComplete(BookEvent):
+    type = "book_complete"
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.payload = payload
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "payload": self.payload}
@@ -0,0 +1,193 @@
+# book_agent/checkpoints.py
+"""
+Local checkpoints for resumable book runs.
+
+Every completed step of generate_book_payload_async (outline, front
+matter, each chapter, storage result) is written as one JSON file under
+  <directory>/<run_id>/<step>.json
+using an atomic rename, so a file is either complete or absent even if the
+process dies mid-write. Re-running with the same run_id loads the finished
+steps and only does the work that is still missing.
+
+Chapter checkpoints are keyed on the chapter's outline entry as well as its
+number, so a chapter written against an outline that was never finished is
+not reused against a different, regenerated outline.
+
+A run opened with its book_spec records a hash of the spec
+(book_spec.sha256). If the same run_id is later opened with a DIFFERENT
+spec (e.g. an edited or reordered batch file whose ids are line numbers),
+the old steps are discarded instead of resumed into the wrong book.
+
+Nothing is deleted automatically: callers that are done with a run (e.g.
+the queue worker, once a job's result is recorded) call clear().
+
+The default store directory comes from BOOK_BOT_CHECKPOINT_DIR
+(default ".book_checkpoints"); checkpointing only happens for runs that
+are given a run_id.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_DIR = ".book_checkpoints"
+
+# Hash of the run's book_spec (not a step: no .json suffix).
+SPEC_HASH_FILE = "book_spec.sha256"
+
+
+def _safe_name(value: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_.-]+", "-", value).strip("-.") or "run"
+
+
+def chapter_checkpoint_key(outline_chapter: Dict[str, Any]) -> str:
+    """
+    Step name for a chapter: its number plus a hash of its outline entry.
+    """
+    digest = hashlib.sha256(
+        json.dumps(outline_chapter, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:12]
+    return f"chapter-{outline_chapter.get('number')}-{digest}"
+
+
+def book_spec_hash(book_spec: Dict[str, Any]) -> str:
+    return hashlib.sha256(
+        json.dumps(book_spec, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+def _atomic_write(directory: str, path: str, text: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class RunCheckpoint:
+    """
+    The checkpoints of ONE run (one directory of step files).
+    """
+
+    def __init__(self, directory: str, run_id: str):
+        self.run_id = run_id
+        self.directory = directory
+        self.stats = {"loaded": 0, "saved": 0}
+
+    def _path(self, step: str) -> str:
+        return os.path.join(self.directory, f"{_safe_name(step)}.json")
+
+    def load(self, step: str) -> Dict[str, Any] | None:
+        """
+        Return the saved result of `step`, or None if it has not completed.
+        """
+        try:
+            with open(self._path(step), "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        self.stats["loaded"] += 1
+        return value
+
+    def save(self, step: str, value: Dict[str, Any]) -> None:
+        """
+        Atomically record the result of `step`.
+        """
+        _atomic_write(
+            self.directory, self._path(step), json.dumps(value, ensure_ascii=False)
+        )
+        self.stats["saved"] += 1
+
+    def bind_spec(self, book_spec: Dict[str, Any]) -> None:
+        """
+        Tie this run to `book_spec`: steps saved for a different spec (or
+        for an unknown one) are discarded, then the spec's hash is recorded.
+        """
+        spec_hash = book_spec_hash(book_spec)
+        hash_path = os.path.join(self.directory, SPEC_HASH_FILE)
+        try:
+            with open(hash_path, "r", encoding="utf-8") as f:
+                saved_hash = f.read().strip()
+        except OSError:
+            saved_hash = None
+        if saved_hash == spec_hash:
+            return
+        stale = self.completed_steps()
+        if stale:
+            logger.warning(
+                "Checkpoint %s was saved for a different book spec; "
+                "discarding %d step(s)",
+                self.run_id,
+                len(stale),
+            )
+            for step in stale:
+                os.remove(os.path.join(self.directory, f"{step}.json"))
+        _atomic_write(self.directory, hash_path, spec_hash)
+
+    def clear(self) -> None:
+        """
+        Delete every checkpoint of this run (e.g. once its result is stored).
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def completed_steps(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(n[: -len(".json")] for n in names if n.endswith(".json"))
+
+
+class CheckpointStore:
+    """
+    Directory holding one RunCheckpoint per run_id.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CHECKPOINT_DIR):
+        self.directory = directory
+
+    def run(self, run_id: str, book_spec: Dict[str, Any] | None = None) -> RunCheckpoint:
+        """
+        The checkpoints of `run_id`; with `book_spec`, only if saved for it
+        (see RunCheckpoint.bind_spec).
+        """
+        checkpoint = RunCheckpoint(os.path.join(self.directory, _safe_name(run_id)), run_id)
+        if book_spec is not None:
+            checkpoint.bind_spec(book_spec)
+        return checkpoint
+
+
+# ---------------------------------------------------------------------
+# Process-wide default store
+# ---------------------------------------------------------------------
+
+_default_store: CheckpointStore | None = None
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """
+    Return the shared store, building it from the environment once.
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = CheckpointStore(
+            os.environ.get("BOOK_BOT_CHECKPOINT_DIR") or DEFAULT_CHECKPOINT_DIR
+        )
+    return _default_store
+
+
+def set_checkpoint_store(store: CheckpointStore) -> None:
+    global _default_store
+    _default_store = store
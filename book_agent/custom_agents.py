@@ -1,7 +1,68 @@
+import threading
+from typing import Callable, Dict
+
 from google.adk.agents import Agent
 from google.adk.tools.agent_tool import AgentTool
 from google.adk.tools import google_search
 
+from .prompt_cache import prompt_cache_before_model
+from .quote_search import search_quotes_tool
+from .rate_limiter import rate_limit_after_model, rate_limit_before_model
+
+# Every model request from every agent waits for the shared RPM/TPM budget
+# (see rate_limiter.py).
+RATE_LIMIT_CALLBACKS = dict(
+    before_model_callback=rate_limit_before_model,
+    after_model_callback=rate_limit_after_model,
+)
+
+
+# ------------------------------------------------------------
+# 0) QUOTE SEARCH AGENT (backend of the cached `search_quotes` tool)
+# ------------------------------------------------------------
+
+# google_search is a built-in grounding tool executed on the model side, so
+# writers never call it directly. They call the function tool
+# `search_quotes` (quote_search.py), which caches results and only runs this
+# agent on a cache miss.
+
+QUOTE_SEARCH_INSTRUCTION = """
+You run ONE web search for inspirational quotes and report the results.
+
+Input JSON:
+{
+  "query": "string",
+  "num_results": 5
+}
+
+Call google_search with input.query, then output JSON ONLY:
+
+{
+  "query": "<input.query>",
+  "results": [
+    {
+      "title": "string",
+      "snippet": "string containing the quote text if present",
+      "url": "string"
+    }
+  ]
+}
+
+Rules:
+- Return at most input.num_results results.
+- Copy snippets faithfully; do NOT invent quotes.
+- Do NOT output Markdown fences or commentary; ONLY the JSON object.
+"""
+
+def _build_quote_search_agent() -> Agent:
+    return Agent(
+        model="gemini-2.5-flash",
+        name="quote_search_agent",
+        instruction=QUOTE_SEARCH_INSTRUCTION,
+        tools=[google_search],
+        **RATE_LIMIT_CALLBACKS,
+    )
+
 
 # ------------------------------------------------------------
 # 1) OUTLINE AGENT
@@ -52,11 +113,58 @@ Rules:
 - Titles must be short and commercially appealing.
 """
 
-outline_agent = Agent(
-    model="gemini-2.5-flash",
-    name="outline_agent",
-    instruction=OUTLINE_INSTRUCTION,
-)
+def _build_outline_agent() -> Agent:
+    return Agent(
+        model="gemini-2.5-flash",
+        name="outline_agent",
+        instruction=OUTLINE_INSTRUCTION,
+        **RATE_LIMIT_CALLBACKS,
+    )
+
+
+# Small follow-up used only when a (locally repaired) outline has fewer
+# than min_chapters chapters; far cheaper than regenerating the outline.
+OUTLINE_TOPUP_INSTRUCTION = """
+You extend an existing non-fiction Kindle book outline with extra chapters.
+
+Input JSON:
+{
+  "book_spec": { ...original user JSON... },
+  "working_title": "string",
+  "existing_chapters": [
+    {"number": 1, "title": "string", "subheading": "string", ...}
+  ],
+  "chapters_needed": <int>
+}
+
+You MUST output JSON ONLY:
+
+{
+  "chapters": [
+    {
+      "number": <continues after the last existing chapter>,
+      "title": "string",
+      "subheading": "string",
+      "approx_word_count": 2000
+    }
+  ]
+}
+
+Rules:
+- Return EXACTLY chapters_needed new chapters.
+- Titles MUST differ from every existing chapter title.
+- New chapters must fit the book's arc and not repeat existing material.
+- Titles must be short and commercially appealing.
+- Use UK English spelling.
+"""
+
+def _build_outline_topup_agent() -> Agent:
+    return Agent(
+        model="gemini-2.5-flash",
+        name="outline_topup_agent",
+        instruction=OUTLINE_TOPUP_INSTRUCTION,
+        **RATE_LIMIT_CALLBACKS,
+    )
 
 
 
@@ -67,10 +175,10 @@ outline_agent = Agent(
 MANUSCRIPT_INSTRUCTION = """
 You write a non-fiction manuscript from an outline.
 
-You ALSO have access to the tool `google_search`.
+You ALSO have access to the tool `search_quotes`.
 
 For EACH CHAPTER:
- - Before choosing the quote, call google_search like:
+ - Before choosing the quote, call search_quotes like:
    {
      "query": "<book_spec.book_topic> <chapter title> inspirational quote",
      "num_results": 5
@@ -112,10 +220,12 @@ You MUST output JSON ONLY:
       "dedication": "string",
       "introduction": "string"
   },
-  "chapters": [ ... ONE entry per outline chapter ... ],
-  "full_book_markdown": "string"
+  "chapters": [ ... ONE entry per outline chapter ... ]
 }
 
+Do NOT output a combined full-book Markdown field; the full book is
+assembled locally from the chapter objects.
+
 CHAPTER RULES
 =============
 - Pull working_title and subtitle from outline.
@@ -168,32 +278,163 @@ Body paragraphs...
 2. ...
 (2–4 questions total)
 
-FULL BOOK MARKDOWN
-==================
-- full_book_markdown must be ONE Markdown string containing:
-  1. Title page (title + subtitle + author_name from book_spec)
-  2. Dedication
-  3. Introduction
-  4. ALL chapters in order of chapter.number, using the exact
-     content_markdown you generated for each chapter.
-
 STYLE RULES
 ===========
 - Use UK English spelling.
 - Aim tone and level at book_spec.target_audience.
 - Respect book_spec.author_voice_style as the general voice.
-- Do NOT mention tools, google_search, ADK, or Google Cloud.
+- Do NOT mention tools, search_quotes, ADK, or Google Cloud.
 - Do NOT output Markdown fences or commentary; ONLY the JSON object.
 """
 
 
-manuscript_agent = Agent(
-    model="gemini-2.5-flash",
-    name="manuscript_agent",
-    instruction=MANUSCRIPT_INSTRUCTION,
-        tools=[google_search],   # << 🔥 important
+def _build_manuscript_agent() -> Agent:
+    return Agent(
+        model="gemini-2.5-flash",
+        name="manuscript_agent",
+        instruction=MANUSCRIPT_INSTRUCTION,
+        tools=[search_quotes_tool],   # << 🔥 important
+        **RATE_LIMIT_CALLBACKS,
+    )
 
-)
+
+
+# ------------------------------------------------------------
+# 2b) PER-CHAPTER FAN-OUT AGENTS (used by workflow.py)
+# ------------------------------------------------------------
+
+# The deterministic workflow no longer asks one agent to write the whole
+# manuscript in a single turn. Instead it runs:
+#   - front_matter_agent once (blurb, dedication, introduction)
+#   - chapter_agent once per outline chapter, concurrently
+# and merges the results back into the manuscript shape described above.
+
+FRONT_MATTER_INSTRUCTION = """
+You write the front matter for a non-fiction Kindle book from its outline.
+
+Input JSON:
+{
+  "outline": { ...outline_agent output... },
+  "book_spec": { ...original user JSON... }
+}
+
+You MUST output JSON ONLY:
+
+{
+  "working_title": "...",
+  "subtitle": "...",
+  "blurb": "...",
+  "front_matter_markdown": {
+      "dedication": "string",
+      "introduction": "string"
+  }
+}
+
+Rules:
+- Pull working_title and subtitle from outline.
+- The introduction should preview the journey through ALL outline chapters.
+- Use UK English spelling.
+- Aim tone and level at book_spec.target_audience.
+- Respect book_spec.author_voice_style as the general voice.
+- Do NOT mention tools, ADK, or Google Cloud.
+- Do NOT output Markdown fences or commentary; ONLY the JSON object.
+"""
+
+def _build_front_matter_agent() -> Agent:
+    return Agent(
+        model="gemini-2.5-flash",
+        name="front_matter_agent",
+        instruction=FRONT_MATTER_INSTRUCTION,
+        **RATE_LIMIT_CALLBACKS,
+    )
+
+
+CHAPTER_INSTRUCTION = """
+You write ONE chapter of a non-fiction manuscript.
+
+You ALSO have access to the tool `search_quotes`.
+
+Before choosing the quote, call search_quotes like:
+  {
+    "query": "<book_spec.book_topic> <chapter.title> inspirational quote",
+    "num_results": 5
+  }
+ - Inspect the `snippet` fields in the returned results.
+ - Extract a plausible short quote + author from a snippet.
+ - If snippets contain no usable quote, create a short fallback quote that fits
+   the chapter theme.
+
+Input JSON:
+{
+  "book_spec": { ...original user JSON... },
+  "working_title": "string",
+  "subtitle": "string",
+  "notes_for_writer": "string",
+  "outline_titles": ["Chapter 1 title", "Chapter 2 title", ...],
+  "chapter": {
+    "number": 1,
+    "title": "string",
+    "subheading": "string",
+    "approx_word_count": 2000
+  }
+}
+
+You MUST output JSON ONLY, a single chapter object:
+
+{
+  "number": <chapter.number>,
+  "title": "string",
+  "subheading": "string",
+  "quote": {
+    "text": "string",
+    "author": "string"
+  },
+  "summary": "short 1–2 sentence summary of the chapter",
+  "content_markdown": "full chapter content in Markdown"
+}
+
+CHAPTER RULES
+=============
+- Keep the same "number" as the input chapter.
+- Keep a title and subheading that preserve the same intent.
+- Use outline_titles only for continuity; write ONLY this chapter.
+
+CONTENT MARKDOWN LAYOUT
+=======================
+
+## Chapter N – Title
+_Subheading_
+> "Quote text"
+> — Author
+
+Body paragraphs...
+
+### Reflection questions
+1. ...
+2. ...
+(2–4 questions total)
+
+STYLE RULES
+===========
+- Use UK English spelling.
+- Aim tone and level at book_spec.target_audience.
+- Respect book_spec.author_voice_style as the general voice.
+- Do NOT mention tools, search_quotes, ADK, or Google Cloud.
+- Do NOT output Markdown fences or commentary; ONLY the JSON object.
+"""
+
+# The shared part of the request (instruction, tools, book_spec and title
+# fields) can be served from a per-book Gemini context cache (see
+# prompt_cache.py); the rate limiter still sees the full request first.
+def _build_chapter_agent() -> Agent:
+    return Agent(
+        model="gemini-2.5-flash",
+        name="chapter_agent",
+        instruction=CHAPTER_INSTRUCTION,
+        tools=[search_quotes_tool],
+        before_model_callback=[rate_limit_before_model, prompt_cache_before_model],
+        after_model_callback=rate_limit_after_model,
+    )
 
 
 
@@ -238,20 +479,27 @@ Rules:
 - Do NOT add commentary or Markdown.
 - Output must be valid JSON only.
 """
-from .tools import save_book_to_gcs
 
-gcs_save_agent = Agent(
-    model="gemini-2.5-flash",
-    name="gcs_save_agent",
-    instruction=GCS_SAVE_INSTRUCTION,
-    tools=[save_book_to_gcs],
-)
+# NOTE: workflow.py no longer routes the manuscript through this agent; it
+# calls tools.save_book_to_gcs directly. The agent is kept for ADK Web /
+# SequentialAgent pipelines that need an LLM-driven save step.
+def _build_gcs_save_agent() -> Agent:
+    # tools pulls in the storage backends; only this agent needs them.
+    from .tools import save_book_to_gcs_tool
+
+    return Agent(
+        model="gemini-2.5-flash",
+        name="gcs_save_agent",
+        instruction=GCS_SAVE_INSTRUCTION,
+        tools=[save_book_to_gcs_tool],
+        **RATE_LIMIT_CALLBACKS,
+    )
 
 # ------------------------------------------------------------
-# 4) CHAPTER WRITER AGENTS (PARALLEL DEMO)
+# 4) CHAPTER WRITER AGENTS (PARALLEL PIPELINE)
 # ------------------------------------------------------------
 
-# For now this is a DEMO that writes up to N chapters in parallel.
+# One writer agent is built per outline chapter at run time.
 # Each agent is responsible for *one* chapter number.
 # They rely on:
 #   - The original user JSON ("book_spec" style payload)
@@ -282,8 +530,8 @@ Your job is:
    - Let subheading = that chapter's subtitle (or similar field).
    - Use the overall book spec (topic, audience, author_voice_style) to shape the voice.
 
-3. Use the google_search tool to find an inspirational quote:
-   - Call google_search with a query like:
+3. Use the search_quotes tool to find an inspirational quote:
+   - Call search_quotes with a query like:
      "<book topic> <working_title> inspirational quote"
    - Inspect the snippets in the results.
    - Extract a short, plausible quote and author.
@@ -321,17 +569,85 @@ Rules:
 - NEVER output Markdown fences, backticks, or extra commentary.
 """
 
-# For the demo, we will create a small fixed pool of chapter agents.
-# Later we can expand this or generate them programmatically for all chapters.
-DEMO_CHAPTER_AGENT_COUNT = 3  # start small for testing
 
-chapter_writer_agents = [
-    Agent(
+def build_chapter_writer_agent(
+    chapter_number: int,
+    name: str | None = None,
+    scoped: bool = False,
+) -> Agent:
+    """
+    Build a chapter writer agent responsible for `chapter_number` only.
+
+    Writers are created on demand (one per outline chapter) by the
+    ParallelAgent pipeline in agent.py, rather than from a fixed-size list.
+
+    scoped=True builds a writer that sees NO conversation history
+    (include_contents="none"): it answers the single chapter_agent-style
+    input message (book spec + its own outline entry) that the pipeline
+    posts on its branch, so its prompt does not grow with the book.
+    """
+    if scoped:
+        return Agent(
+            model="gemini-2.5-flash",
+            name=name or f"chapter_writer_{chapter_number}",
+            instruction=CHAPTER_INSTRUCTION,
+            include_contents="none",
+            tools=[search_quotes_tool],
+            **RATE_LIMIT_CALLBACKS,
+        )
+    return Agent(
         model="gemini-2.5-flash",
-        name=f"chapter_writer_{i}",
-        instruction=CHAPTER_WRITER_INSTRUCTION_TEMPLATE.format(chapter_number=i),
-        tools=[google_search],
+        name=name or f"chapter_writer_{chapter_number}",
+        instruction=CHAPTER_WRITER_INSTRUCTION_TEMPLATE.format(
+            chapter_number=chapter_number
+        ),
+        tools=[search_quotes_tool],
+        **RATE_LIMIT_CALLBACKS,
     )
-    for i in range(1, DEMO_CHAPTER_AGENT_COUNT + 1)
-]
 
+
+# ------------------------------------------------------------
+# 5) AGENT REGISTRY
+# ------------------------------------------------------------
+
+# Agents are built on first use, not at import: a process that only runs
+# the outline step builds only outline_agent, and one that never saves
+# through an agent never imports tools / google.cloud.storage.
+# get_agent(name) and plain attribute access (custom_agents.outline_agent,
+# `from .custom_agents import outline_agent`) both go through the registry
+# and return the same cached instance.
+AGENT_BUILDERS: Dict[str, Callable[[], Agent]] = {
+    "quote_search_agent": _build_quote_search_agent,
+    "outline_agent": _build_outline_agent,
+    "outline_topup_agent": _build_outline_topup_agent,
+    "manuscript_agent": _build_manuscript_agent,
+    "front_matter_agent": _build_front_matter_agent,
+    "chapter_agent": _build_chapter_agent,
+    "gcs_save_agent": _build_gcs_save_agent,
+}
+
+_agents: Dict[str, Agent] = {}
+_agents_lock = threading.Lock()
+
+
+def get_agent(name: str) -> Agent:
+    """
+    Return the shared agent registered as `name`, building it on first use.
+    """
+    agent = _agents.get(name)
+    if agent is None:
+        builder = AGENT_BUILDERS.get(name)
+        if builder is None:
+            raise KeyError(f"Unknown agent: {name!r}")
+        with _agents_lock:
+            agent = _agents.get(name)
+            if agent is None:
+                agent = _agents[name] = builder()
+    return agent
+
+
+def __getattr__(name: str) -> Agent:
+    # PEP 562: module attributes for the registered agents.
+    if name in AGENT_BUILDERS:
+        return get_agent(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
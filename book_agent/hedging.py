@@ -0,0 +1,174 @@
+# book_agent/hedging.py
+"""
+Hedged requests for tail-latency chapters.
+
+With many chapters in flight, a book waits for its slowest chapter. With
+hedging on, a chapter request still running after the `percentile`-th
+percentile of recently observed chapter latencies gets a duplicate
+request. The first attempt to return a VALID chapter wins and the other
+one is cancelled.
+
+Hedges respect the global rate budget:
+  - each attempt is an ordinary model call, so it takes an
+    AdaptiveRateLimiter slot and RPM/TPM budget like any other
+  - a hedge is only fired while the limiter has headroom (a free
+    concurrency slot and request budget); it never queues behind
+    first-attempt work
+  - nothing is hedged until `min_samples` latencies have been observed
+
+stats counts requests, hedges_fired, hedges_won (the duplicate finished
+first) and hedges_skipped (due, but no headroom).
+
+When a hedge wins, both its latency and the cancelled primary's elapsed
+time (a censored sample: the primary would have taken at least that long)
+are recorded, so the threshold is not biased towards fast requests.
+
+Hedging is OFF unless configured, either in code with
+set_chapter_hedger(RequestHedger(...)) or via the environment:
+  BOOK_BOT_HEDGE                "1" to hedge chapter requests
+  BOOK_BOT_HEDGE_PERCENTILE     latency percentile to hedge at (default 95)
+  BOOK_BOT_HEDGE_MIN_SAMPLES    latencies needed before hedging (default 8)
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, TypeVar
+
+from .rate_limiter import get_rate_limiter
+
+T = TypeVar("T")
+
+DEFAULT_HEDGE_PERCENTILE = 95.0
+DEFAULT_MIN_SAMPLES = 8
+DEFAULT_WINDOW = 200
+
+
+class RequestHedger:
+    """
+    Fires a duplicate of a slow request and keeps whichever finishes first.
+    """
+
+    def __init__(
+        self,
+        percentile: float = DEFAULT_HEDGE_PERCENTILE,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        window: int = DEFAULT_WINDOW,
+    ):
+        self.percentile = percentile
+        self.min_samples = max(1, min_samples)
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.stats = {
+            "requests": 0,
+            "hedges_fired": 0,
+            "hedges_won": 0,
+            "hedges_skipped": 0,
+        }
+
+    def threshold(self) -> float | None:
+        """
+        Seconds after which a request is hedged (None until warmed up).
+        """
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(
+            len(ordered) - 1,
+            max(0, round(self.percentile / 100 * (len(ordered) - 1))),
+        )
+        return ordered[index]
+
+    def record(self, latency_s: float) -> None:
+        self.latencies.append(latency_s)
+
+    async def run(
+        self,
+        primary: Callable[[], Awaitable[T]],
+        hedge: Callable[[], Awaitable[T]] | None = None,
+    ) -> T:
+        """
+        Await primary(); if it is still running at threshold(), also start
+        hedge() (default: primary again) and return the first SUCCESSFUL
+        result. An attempt that raises (e.g. failed validation) does not
+        win; if both raise, the first error is re-raised.
+        """
+        self.stats["requests"] += 1
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(primary())]
+        try:
+            delay = self.threshold()
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if get_rate_limiter().has_headroom():
+                    self.stats["hedges_fired"] += 1
+                    hedge_started = time.perf_counter()
+                    tasks.append(asyncio.create_task((hedge or primary)()))
+                else:
+                    self.stats["hedges_skipped"] += 1
+
+            pending = set(tasks)
+            first_error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    error = task.exception()
+                    if error is not None:
+                        first_error = first_error or error
+                        continue
+                    if task is tasks[0]:
+                        self.record(time.perf_counter() - started)
+                    else:
+                        self.stats["hedges_won"] += 1
+                        self.record(time.perf_counter() - hedge_started)
+                        if not tasks[0].done():
+                            # The slow primary is cancelled, but its elapsed
+                            # time is a lower bound on its latency; leaving
+                            # it out would drag the threshold down.
+                            self.record(time.perf_counter() - started)
+                    return task.result()
+            raise first_error
+        finally:
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                task.cancel()
+            # Let the loser release its rate-limiter slot and session.
+            await asyncio.gather(*losers, return_exceptions=True)
+
+
+# ---------------------------------------------------------------------
+# Process-wide chapter hedger (opt-in)
+# ---------------------------------------------------------------------
+
+_chapter_hedger: RequestHedger | None = None
+_chapter_hedger_loaded = False
+
+
+def set_chapter_hedger(hedger: RequestHedger | None) -> None:
+    """
+    Install (or, with None, disable) the hedger used for chapter requests.
+    """
+    global _chapter_hedger, _chapter_hedger_loaded
+    _chapter_hedger = hedger
+    _chapter_hedger_loaded = True
+
+
+def get_chapter_hedger() -> RequestHedger | None:
+    """
+    Return the process-wide hedger, building it from the environment once.
+    """
+    global _chapter_hedger, _chapter_hedger_loaded
+    if not _chapter_hedger_loaded:
+        _chapter_hedger_loaded = True
+        if os.environ.get("BOOK_BOT_HEDGE") == "1":
+            _chapter_hedger = RequestHedger(
+                percentile=float(
+                    os.environ.get("BOOK_BOT_HEDGE_PERCENTILE", DEFAULT_HEDGE_PERCENTILE)
+                ),
+                min_samples=int(
+                    os.environ.get("BOOK_BOT_HEDGE_MIN_SAMPLES", DEFAULT_MIN_SAMPLES)
+                ),
+            )
+    return _chapter_hedger
@@ -0,0 +1,302 @@
+# book_agent/job_queue.py
+"""
+Persistent book job queue in a local SQLite file.
+
+Each job is one book spec. Workers (see worker.py) LEASE jobs:
+  - a lease lasts `visibility_timeout_s`; the holder extends it with
+    heartbeat() while the book is being generated
+  - a job whose lease expires (worker crashed or hung) becomes visible
+    again and is leased by another worker
+  - every lease counts as an attempt; after `max_attempts` the job is
+    marked "failed" instead of being leased again
+  - a failed attempt (fail()) is retried after an exponential backoff
+  - complete() / fail() only take effect for the CURRENT lease holder, so
+    a worker whose lease expired cannot overwrite the result of the
+    worker that took the job over
+
+Job states: queued -> leased -> done | failed (leased -> queued on retry).
+
+The queue file can be shared by worker processes on one box (default WAL
+journal), or by several boxes on a shared filesystem with
+journal_mode="DELETE" (WAL needs shared memory, which network
+filesystems do not provide).
+
+Usage:
+    python -m book_agent.job_queue enqueue jobs.db specs.jsonl
+    python -m book_agent.job_queue status jobs.db
+    python -m book_agent.job_queue results jobs.db results.jsonl
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+DEFAULT_VISIBILITY_TIMEOUT_S = 15 * 60
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY_S = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id               TEXT PRIMARY KEY,
+    book_spec        TEXT NOT NULL,
+    status           TEXT NOT NULL DEFAULT 'queued',
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    available_at     REAL NOT NULL,
+    lease_owner      TEXT,
+    lease_expires_at REAL,
+    result           TEXT,
+    error            TEXT,
+    created_at       REAL NOT NULL,
+    updated_at       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+"""
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of book jobs with leases and retry counts.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        visibility_timeout_s: float = DEFAULT_VISIBILITY_TIMEOUT_S,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        journal_mode: str = "WAL",
+    ):
+        self.path = path
+        self.visibility_timeout_s = visibility_timeout_s
+        self.max_attempts = max(1, max_attempts)
+        self.journal_mode = journal_mode
+        with self._connect() as db:
+            db.execute(f"PRAGMA journal_mode={journal_mode}")
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per operation: safe from any thread or
+        # process, and no connection outlives a fork.
+        db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as db:
+            # IMMEDIATE takes the write lock up front, so two workers can
+            # never lease the same job.
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    # -----------------------------------------------------------------
+    # Producers
+    # -----------------------------------------------------------------
+    def enqueue(self, book_spec: Dict[str, Any], job_id: str | None = None) -> str:
+        """
+        Add a job; re-enqueueing an existing job_id is a no-op.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR IGNORE INTO jobs (id, book_spec, available_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (job_id, json.dumps(book_spec, ensure_ascii=False), now, now, now),
+            )
+        return job_id
+
+    # -----------------------------------------------------------------
+    # Workers
+    # -----------------------------------------------------------------
+    def lease(self, worker_id: str, limit: int = 1) -> List[Dict[str, Any]]:
+        """
+        Lease up to `limit` ready jobs: [{"id", "book_spec", "attempts"}].
+
+        Ready means queued and past its retry backoff, or leased with an
+        expired lease. Expired jobs that have used every attempt are marked
+        failed instead.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'failed', lease_owner = NULL, updated_at = ?,"
+                " error = COALESCE(error, 'lease expired') "
+                "WHERE status = 'leased' AND lease_expires_at <= ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            rows = db.execute(
+                "SELECT id, book_spec, attempts FROM jobs "
+                "WHERE (status = 'queued' AND available_at <= ?)"
+                "   OR (status = 'leased' AND lease_expires_at <= ?) "
+                "ORDER BY created_at LIMIT ?",
+                (now, now, max(0, limit)),
+            ).fetchall()
+            for job_id, _, _ in rows:
+                db.execute(
+                    "UPDATE jobs SET status = 'leased', attempts = attempts + 1,"
+                    " lease_owner = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                    (worker_id, now + self.visibility_timeout_s, now, job_id),
+                )
+        return [
+            {"id": job_id, "book_spec": json.loads(spec), "attempts": attempts + 1}
+            for job_id, spec, attempts in rows
+        ]
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """
+        Extend the lease; False if `worker_id` no longer holds it.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (now + self.visibility_timeout_s, now, job_id, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """
+        Mark the job done with `result`; False if the lease was lost.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL,"
+                " lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (json.dumps(result, ensure_ascii=False), now, job_id, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """
+        Record a failed attempt: retried with backoff while attempts remain,
+        otherwise marked failed. False if the lease was lost.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (job_id, worker_id),
+            ).fetchone()
+            if row is None:
+                return False
+            attempts = row[0]
+            if attempts >= self.max_attempts:
+                status, available_at = "failed", now
+            else:
+                status = "queued"
+                available_at = now + RETRY_BASE_DELAY_S * (2 ** (attempts - 1))
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?,"
+                " lease_owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                (status, error, available_at, now, job_id),
+            )
+        return True
+
+    # -----------------------------------------------------------------
+    # Inspection
+    # -----------------------------------------------------------------
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {"queued": 0, "leased": 0, "done": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def has_unfinished(self) -> bool:
+        """
+        True while any job is queued or leased.
+        """
+        counts = self.counts()
+        return counts["queued"] + counts["leased"] > 0
+
+    def finished_jobs(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield done/failed jobs as batch.py-style result records.
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, status, attempts, result, error FROM jobs "
+                "WHERE status IN ('done', 'failed') ORDER BY created_at"
+            )
+            for job_id, status, attempts, result, error in rows:
+                record: Dict[str, Any] = {"id": job_id, "attempts": attempts}
+                if status == "done":
+                    record.update(status="ok", payload=json.loads(result))
+                else:
+                    record.update(status="error", error=error)
+                yield record
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the book job queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add the specs of a JSONL file")
+    enqueue.add_argument("queue_path")
+    enqueue.add_argument("input_path", help="JSONL file of book specs (as batch.py)")
+
+    status = commands.add_parser("status", help="print job counts per state")
+    status.add_argument("queue_path")
+
+    results = commands.add_parser("results", help="export finished jobs as JSONL")
+    results.add_argument("queue_path")
+    results.add_argument("output_path")
+
+    args = parser.parse_args()
+    queue = JobQueue(args.queue_path)
+
+    if args.command == "enqueue":
+        # Imported here: batch pulls in the whole workflow, which producers
+        # that only enqueue (e.g. a web front end) never need.
+        from .batch import read_book_specs
+
+        prefix = os.path.basename(args.input_path)
+        added = 0
+        invalid: List[str] = []
+        for book_id, book_spec in read_book_specs(args.input_path):
+            if isinstance(book_spec, ValueError):
+                invalid.append(str(book_spec))
+                continue
+            # Stable IDs: enqueueing the same file twice adds nothing new.
+            queue.enqueue(book_spec, job_id=f"{prefix}-{book_id}")
+            added += 1
+        print(
+            json.dumps({"enqueued": added, "invalid": invalid, **queue.counts()}),
+            file=sys.stderr,
+        )
+    elif args.command == "status":
+        print(json.dumps(queue.counts(), indent=2))
+    else:
+        with open(args.output_path, "w", encoding="utf-8") as out:
+            for record in queue.finished_jobs():
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# book_agent/json_utils.py
+"""
+Helpers for turning raw model text into JSON objects.
+
+Models occasionally wrap their JSON in ``` fences or append commentary.
+These helpers are shared by workflow.py (InMemoryRunner steps) and
+agent.py (ParallelAgent pipeline reading the outline from session state).
+"""
+
+import json
+from typing import Any, Dict
+
+
+def clean_json_text(text: str) -> str:
+    """
+    Strip whitespace and ```json ... ``` / ``` ... ``` fences if present.
+    """
+
+    text = text.strip()
+
+    if text.startswith("```"):
+        lines = text.splitlines()
+        if len(lines) > 1:
+            # drop first line (``` or ```json)
+            lines = lines[1:]
+        if lines and lines[-1].strip().startswith("```"):
+            # drop last line (```)
+            lines = lines[:-1]
+        text = "\n".join(lines).strip()
+
+    return text
+
+
+def parse_json_object(text: str, agent_name: str) -> Dict[str, Any]:
+    """
+    Clean `text` and parse the FIRST JSON object in it.
+
+    Raises RuntimeError (naming `agent_name`) if no JSON can be parsed.
+    """
+
+    text = clean_json_text(text)
+
+    # Use JSONDecoder.raw_decode to parse the FIRST JSON object only
+    try:
+        decoder = json.JSONDecoder()
+        obj, _ = decoder.raw_decode(text.lstrip())
+        return obj
+    except json.JSONDecodeError as e:
+        raise RuntimeError(
+            f"Agent {agent_name} returned non-JSON even after cleaning:\n{text}"
+        ) from e
+
+
+class IncrementalArrayParser:
+    """
+    Incrementally extract the items of ONE top-level array from a JSON
+    object that is still being streamed, e.g. the outline's "chapters".
+
+    Feed it text chunks as they arrive; each call to feed() returns the
+    array items (dicts) whose closing brace has just been seen. Top-level
+    string fields that finish before/while the array streams (for the
+    outline: working_title, subtitle) are exposed via `header`.
+
+    Anything before the first "{" (such as a ```json fence) is ignored.
+    """
+
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self.header: Dict[str, Any] = {}
+        self.items_emitted = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Start scanning a fresh stream (e.g. a retried request).
+
+        Items already returned are not returned again: the first
+        `items_emitted` items of the new stream are skipped.
+        """
+        self._items_seen = 0
+        self._buffer: list[str] = []
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_key: str | None = None
+        self._expect_value = False
+        self._array_depth: int | None = None
+        self._item_start = -1
+
+    def _text(self, start: int, end: int) -> str:
+        return "".join(self._buffer[start:end])
+
+    def feed(self, chunk: str) -> list[Dict[str, Any]]:
+        """
+        Consume `chunk` and return any array items completed by it.
+        """
+
+        completed: list[Dict[str, Any]] = []
+        self._buffer.extend(chunk)
+
+        while self._pos < len(self._buffer):
+            ch = self._buffer[self._pos]
+            pos = self._pos
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._on_top_level_string(
+                            self._text(self._string_start, pos + 1)
+                        )
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif ch in "{[":
+                if self._depth == 0 and ch != "{":
+                    continue
+                if (
+                    ch == "["
+                    and self._depth == 1
+                    and self._last_key == self.array_key
+                    and self._expect_value
+                ):
+                    self._array_depth = self._depth + 1
+                elif (
+                    ch == "{"
+                    and self._array_depth is not None
+                    and self._depth == self._array_depth
+                ):
+                    self._item_start = pos
+                if self._depth == 1:
+                    self._expect_value = False
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    continue
+                self._depth -= 1
+                if (
+                    ch == "}"
+                    and self._array_depth is not None
+                    and self._depth == self._array_depth
+                    and self._item_start >= 0
+                ):
+                    item_text = self._text(self._item_start, pos + 1)
+                    self._item_start = -1
+                    try:
+                        item = json.loads(item_text)
+                    except json.JSONDecodeError:
+                        continue
+                    self._items_seen += 1
+                    if self._items_seen <= self.items_emitted:
+                        continue
+                    self.items_emitted += 1
+                    completed.append(item)
+                elif ch == "]" and self._array_depth is not None and self._depth == 1:
+                    self._array_depth = None
+            elif ch == ":" and self._depth == 1:
+                self._expect_value = True
+            elif ch == "," and self._depth == 1:
+                self._expect_value = False
+                self._last_key = None
+
+        return completed
+
+    def _on_top_level_string(self, token: str) -> None:
+        try:
+            value = json.loads(token)
+        except json.JSONDecodeError:
+            return
+        if self._expect_value and self._last_key is not None:
+            self.header[self._last_key] = value
+            self._expect_value = False
+        else:
+            self._last_key = value
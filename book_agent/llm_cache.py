@@ -0,0 +1,276 @@
+# book_agent/llm_cache.py
+"""
+Content-addressed, disk-backed cache of parsed agent responses.
+
+Re-running the same (or a retried) book spec should not pay for the same
+model calls twice. Entries are keyed on:
+  - agent name
+  - model name
+  - SHA-256 of the agent instruction
+  - canonical JSON of the agent input
+and stored as one JSON file per key under a local directory.
+
+Eviction is LRU by file mtime (touched on every hit):
+  - entries older than max_age_seconds are dropped on read and on eviction
+  - when the directory grows past max_bytes, least-recently-used entries
+    are removed until it is back under the low-water mark (90% of
+    max_bytes by default)
+
+The cache is OFF unless configured, either in code with
+set_default_cache(LLMResponseCache(...)) or via the environment:
+  BOOK_BOT_LLM_CACHE_DIR           directory to store entries in
+  BOOK_BOT_LLM_CACHE_MAX_BYTES     optional, default 512 MiB
+  BOOK_BOT_LLM_CACHE_MAX_AGE_S     optional, default 7 days
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_LOW_WATER = 0.9
+
+
+def _model_name(agent) -> str:
+    model = getattr(agent, "model", "")
+    # Agents may carry a BaseLlm instance instead of a model string.
+    return getattr(model, "model", None) or str(model)
+
+
+def _instruction_text(agent) -> str:
+    instruction = getattr(agent, "instruction", "")
+    if callable(instruction):
+        return getattr(instruction, "__qualname__", repr(instruction))
+    return instruction or ""
+
+
+def make_cache_key(agent, input_obj: Dict[str, Any]) -> str:
+    """
+    Content address for one agent call.
+    """
+
+    instruction_hash = hashlib.sha256(
+        _instruction_text(agent).encode("utf-8")
+    ).hexdigest()
+    canonical_input = json.dumps(
+        input_obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    material = json.dumps(
+        [agent.name, _model_name(agent), instruction_hash, canonical_input],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Local-disk cache of parsed JSON responses with size/age LRU eviction.
+
+    Sizes and last-use times are kept in an in-memory index (built from
+    the directory once), so put() does not rescan the disk. evict() does
+    rescan, picking up entries written by other processes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+        low_water: float = DEFAULT_LOW_WATER,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        # Evict down to this many bytes, so that one put over the limit
+        # does not trigger another eviction on the very next put.
+        self.low_water_bytes = int(max_bytes * low_water)
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        # path -> (size, last use time)
+        self._index: Dict[str, Tuple[int, float]] = {}
+        self._total_bytes = 0
+        self._load_index()
+
+    # -----------------------------------------------------------------
+    # Internal helpers
+    # -----------------------------------------------------------------
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _entries(self) -> List[Tuple[str, int, float]]:
+        """
+        (path, size, mtime) for every entry on disk.
+        """
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _load_index(self) -> None:
+        self._index = {path: (size, mtime) for path, size, mtime in self._entries()}
+        self._total_bytes = sum(size for size, _ in self._index.values())
+
+    def _remove(self, path: str) -> None:
+        size, _ = self._index.pop(path, (0, 0.0))
+        self._total_bytes -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        self.stats["evictions"] += 1
+
+    # -----------------------------------------------------------------
+    # Public API
+    # -----------------------------------------------------------------
+    def get(self, key: str) -> Dict[str, Any] | None:
+        """
+        Return the cached object for `key`, or None on a miss.
+
+        Blocking file I/O; call from a thread in async code.
+        """
+
+        path = self._path(key)
+        with self._lock:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                # Deleted behind our back (another process's eviction).
+                self._total_bytes -= self._index.pop(path, (0, 0.0))[0]
+                self.stats["misses"] += 1
+                return None
+
+            if time.time() - st.st_mtime > self.max_age_seconds:
+                self._remove(path)
+                self.stats["misses"] += 1
+                return None
+
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._remove(path)
+                self.stats["misses"] += 1
+                return None
+
+            # Touch so eviction treats this entry as recently used (the
+            # mtime carries that across restarts).
+            os.utime(path, None)
+            previous_size = self._index.get(path, (0, 0.0))[0]
+            self._index[path] = (st.st_size, time.time())
+            self._total_bytes += st.st_size - previous_size
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Store `value` under `key` (atomic write), then evict if needed.
+
+        Blocking file I/O; call from a thread in async code.
+        """
+
+        path = self._path(key)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+
+            previous_size = self._index.get(path, (0, 0.0))[0]
+            self._index[path] = (len(data), time.time())
+            self._total_bytes += len(data) - previous_size
+            self.stats["writes"] += 1
+
+            if self._total_bytes > self.max_bytes:
+                self._evict_locked()
+
+    def evict(self) -> None:
+        """
+        Rescan the directory, then drop expired entries and LRU entries
+        until under the low-water mark.
+        """
+        with self._lock:
+            self._load_index()
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        now = time.time()
+        entries = sorted(self._index.items(), key=lambda e: e[1][1])
+
+        live = []
+        for path, (_, used) in entries:
+            if now - used > self.max_age_seconds:
+                self._remove(path)
+            else:
+                live.append(path)
+
+        if self._total_bytes <= self.max_bytes:
+            return
+        for path in live:
+            if self._total_bytes <= self.low_water_bytes:
+                break
+            self._remove(path)
+
+
+# ---------------------------------------------------------------------
+# Process-wide default cache (opt-in)
+# ---------------------------------------------------------------------
+
+_default_cache: LLMResponseCache | None = None
+_default_cache_loaded = False
+
+
+def set_default_cache(cache: LLMResponseCache | None) -> None:
+    """
+    Install (or, with None, disable) the cache used by workflow.py.
+    """
+    global _default_cache, _default_cache_loaded
+    _default_cache = cache
+    _default_cache_loaded = True
+
+
+def get_default_cache() -> LLMResponseCache | None:
+    """
+    Return the process-wide cache, building it from the environment once.
+    """
+    global _default_cache, _default_cache_loaded
+    if not _default_cache_loaded:
+        _default_cache_loaded = True
+        directory = os.environ.get("BOOK_BOT_LLM_CACHE_DIR")
+        if directory:
+            _default_cache = LLMResponseCache(
+                directory,
+                max_bytes=int(
+                    os.environ.get("BOOK_BOT_LLM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+                ),
+                max_age_seconds=float(
+                    os.environ.get(
+                        "BOOK_BOT_LLM_CACHE_MAX_AGE_S", DEFAULT_MAX_AGE_SECONDS
+                    )
+                ),
+            )
+    return _default_cache
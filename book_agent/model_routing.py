@@ -0,0 +1,210 @@
+# book_agent/model_routing.py
+"""
+Per-step and per-chapter model routing.
+
+Every agent in custom_agents.py is defined with gemini-2.5-flash. A
+ModelRouter picks the model actually used for each step from
+configuration, so quality can be traded for throughput deliberately:
+
+  - steps:          model per logical step ("outline", "outline_topup",
+                    "front_matter", "chapter", "quote_search")
+  - short_chapter:  model for chapters whose outline entry asks for at most
+                    `max_words` words (approx_word_count)
+  - fallback_model + latency_budgets_s:
+                    a step whose budget would be exceeded (time already
+                    spent on it + the chosen model's observed latency for
+                    that step, times `budget_headroom`) switches to the
+                    faster fallback model; every `probe_every`-th such
+                    request still goes to the chosen model (reason
+                    "probe"), so a model pushed over budget by a few slow
+                    samples gets fresh samples and can recover
+
+Each choice is returned as {"step", "model", "reason"} with reason one of
+"default", "step", "short_chapter", "latency_budget" or "probe"; the workflows
+record it on the run trace step. Observed latencies (an EWMA per step and
+model) are fed back with record_latency().
+
+Routing is OFF unless configured, either in code with
+set_model_router(ModelRouter(...)) or via the environment:
+  BOOK_BOT_MODEL_ROUTES   JSON object, or the path of a JSON file, e.g.
+    {
+      "default": "gemini-2.5-flash",
+      "steps": {"outline": "gemini-2.5-flash-lite"},
+      "short_chapter": {"model": "gemini-2.5-flash-lite", "max_words": 1200},
+      "fallback_model": "gemini-2.5-flash-lite",
+      "latency_budgets_s": {"chapter": 90},
+      "budget_headroom": 0.8,
+      "probe_every": 10
+    }
+"""
+
+import json
+import os
+from typing import Any, Dict, Tuple
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+DEFAULT_SHORT_CHAPTER_WORDS = 1200
+DEFAULT_BUDGET_HEADROOM = 0.8
+DEFAULT_PROBE_EVERY = 10
+
+# Weight of the newest sample in the per-(step, model) latency average.
+LATENCY_EWMA_ALPHA = 0.3
+
+
+def _approx_words(chapter: Dict[str, Any] | None) -> int | None:
+    if not isinstance(chapter, dict):
+        return None
+    try:
+        return int(chapter.get("approx_word_count"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelRouter:
+    """
+    Chooses a model per step (and per chapter) from configuration.
+    """
+
+    def __init__(
+        self,
+        default_model: str = DEFAULT_MODEL,
+        step_models: Dict[str, str] | None = None,
+        short_chapter_model: str | None = None,
+        short_chapter_max_words: int = DEFAULT_SHORT_CHAPTER_WORDS,
+        fallback_model: str | None = None,
+        latency_budgets_s: Dict[str, float] | None = None,
+        budget_headroom: float = DEFAULT_BUDGET_HEADROOM,
+        probe_every: int = DEFAULT_PROBE_EVERY,
+    ):
+        self.default_model = default_model
+        self.step_models = dict(step_models or {})
+        self.short_chapter_model = short_chapter_model
+        self.short_chapter_max_words = short_chapter_max_words
+        self.fallback_model = fallback_model
+        self.latency_budgets_s = dict(latency_budgets_s or {})
+        self.budget_headroom = budget_headroom
+        self.probe_every = max(1, probe_every)
+        self._latency: Dict[Tuple[str, str], float] = {}
+        # (step, model) -> requests sent to the fallback because of that
+        # model's expected latency since it was last probed.
+        self._diverted: Dict[Tuple[str, str], int] = {}
+        # (id(agent), model) -> copy of the agent using that model
+        self._agents: Dict[Tuple[int, str], Tuple[Any, Any]] = {}
+        self.stats: Dict[str, Dict[str, int]] = {"models": {}, "reasons": {}}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ModelRouter":
+        short_chapter = config.get("short_chapter") or {}
+        return cls(
+            default_model=config.get("default") or DEFAULT_MODEL,
+            step_models=config.get("steps"),
+            short_chapter_model=short_chapter.get("model"),
+            short_chapter_max_words=int(
+                short_chapter.get("max_words", DEFAULT_SHORT_CHAPTER_WORDS)
+            ),
+            fallback_model=config.get("fallback_model"),
+            latency_budgets_s=config.get("latency_budgets_s"),
+            budget_headroom=float(config.get("budget_headroom", DEFAULT_BUDGET_HEADROOM)),
+            probe_every=int(config.get("probe_every", DEFAULT_PROBE_EVERY)),
+        )
+
+    # -----------------------------------------------------------------
+    # Decisions
+    # -----------------------------------------------------------------
+    def expected_latency(self, step: str, model: str) -> float | None:
+        return self._latency.get((step, model))
+
+    def choose(
+        self,
+        step: str,
+        chapter: Dict[str, Any] | None = None,
+        elapsed_s: float = 0.0,
+    ) -> Dict[str, str]:
+        """
+        Model for one request of `step`; `elapsed_s` is the time already
+        spent on this step (e.g. by failed attempts).
+        """
+        model, reason = self.default_model, "default"
+        if step in self.step_models:
+            model, reason = self.step_models[step], "step"
+        words = _approx_words(chapter)
+        if (
+            self.short_chapter_model
+            and words is not None
+            and words <= self.short_chapter_max_words
+        ):
+            model, reason = self.short_chapter_model, "short_chapter"
+
+        budget = self.latency_budgets_s.get(step)
+        if budget and self.fallback_model and model != self.fallback_model:
+            allowed = budget * self.budget_headroom
+            expected = self.expected_latency(step, model) or 0.0
+            if elapsed_s + expected > allowed:
+                diverted = self._diverted.get((step, model), 0) + 1
+                if elapsed_s <= allowed and diverted >= self.probe_every:
+                    # Only the (possibly stale) average is over budget:
+                    # re-sample the model instead of avoiding it forever.
+                    self._diverted[(step, model)] = 0
+                    reason = "probe"
+                else:
+                    self._diverted[(step, model)] = diverted
+                    model, reason = self.fallback_model, "latency_budget"
+
+        self.stats["models"][model] = self.stats["models"].get(model, 0) + 1
+        self.stats["reasons"][reason] = self.stats["reasons"].get(reason, 0) + 1
+        return {"step": step, "model": model, "reason": reason}
+
+    def record_latency(self, step: str, model: str, latency_s: float) -> None:
+        previous = self._latency.get((step, model))
+        self._latency[(step, model)] = (
+            latency_s
+            if previous is None
+            else previous + LATENCY_EWMA_ALPHA * (latency_s - previous)
+        )
+
+    def route_agent(self, agent: Any, model: str) -> Any:
+        """
+        `agent` itself if it already uses `model`, else a cached copy that
+        does (so pooled runners and cache keys follow the routed model).
+        """
+        if getattr(agent, "model", None) == model:
+            return agent
+        key = (id(agent), model)
+        entry = self._agents.get(key)
+        if entry is None or entry[0] is not agent:
+            entry = (agent, agent.model_copy(update={"model": model}))
+            self._agents[key] = entry
+        return entry[1]
+
+
+# ---------------------------------------------------------------------
+# Process-wide router (opt-in)
+# ---------------------------------------------------------------------
+
+_model_router: ModelRouter | None = None
+_model_router_loaded = False
+
+
+def set_model_router(router: ModelRouter | None) -> None:
+    """
+    Install (or, with None, disable) the router used by the workflows.
+    """
+    global _model_router, _model_router_loaded
+    _model_router = router
+    _model_router_loaded = True
+
+
+def get_model_router() -> ModelRouter | None:
+    """
+    Return the process-wide router, building it from the environment once.
+    """
+    global _model_router, _model_router_loaded
+    if not _model_router_loaded:
+        _model_router_loaded = True
+        routes = os.environ.get("BOOK_BOT_MODEL_ROUTES", "").strip()
+        if routes:
+            if not routes.startswith("{"):
+                with open(routes, "r", encoding="utf-8") as f:
+                    routes = f.read()
+            _model_router = ModelRouter.from_config(json.loads(routes))
+    return _model_router
@@ -0,0 +1,284 @@
+# book_agent/prompt_cache.py
+"""
+Per-book Gemini context caching of the shared chapter prompt prefix.
+
+Every chapter_agent request for a book repeats the same prefix: the
+(large) chapter instruction, the tool declarations, and every input field
+but `chapter`. ADK's own context caching only starts on the second turn
+of a session, and each chapter is a fresh single-turn session, so it
+never applies here.
+
+A BookPrefixCache is created per book by the workflow:
+  - the workflow hands it the completed outline (set_outline); with the
+    cache on, chapters are not dispatched while the outline streams, so
+    every chapter sees the same, complete shared fields
+  - prompt_cache_before_model (a before_model_callback on chapter_agent)
+    splits the input JSON into the shared fields plus the full outline,
+    and the per-chapter `chapter` entry
+  - the first request for a (model, instruction, tools, shared fields)
+    prefix registers it as Gemini cached content with a TTL; concurrent
+    chapter requests wait for that one creation instead of racing
+  - every request then references the cache (config.cached_content) and
+    sends only the per-chapter part
+  - cleanup() deletes the book's caches when the book finishes (the TTL
+    is only a safety net)
+
+Caching is skipped, and the request sent unchanged, for non-Gemini models,
+requests made before set_outline, prefixes below the model's minimum
+cacheable size, and cache API errors. The cached system instruction gets
+CACHED_INPUT_NOTE appended, since the model then sees the input as two
+messages.
+
+The minimum is large next to a typical prefix: instruction and tools are
+~600 tokens, and with the full outline an 8-18 chapter book comes to
+~1.2k-1.7k tokens. On gemini-2.5 (2048 minimum) caching starts at roughly
+25 chapters or a long book_spec; smaller books are counted in
+skipped_small and run uncached.
+
+stats: created, reused (requests served from a cache), skipped_small,
+errors, deleted.
+
+Configuration:
+  BOOK_BOT_PROMPT_CACHE          "1" to enable (default off)
+  BOOK_BOT_PROMPT_CACHE_TTL_S    cache TTL in seconds (default 1800)
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_S = 1800
+
+# The only input field that differs between a book's chapters (see
+# CHAPTER_INSTRUCTION); everything else goes in the cached prefix.
+PER_CHAPTER_INPUT_KEY = "chapter"
+
+# Added to the cached system instruction only; uncached requests keep the
+# single input object CHAPTER_INSTRUCTION describes.
+CACHED_INPUT_NOTE = """
+The input arrives as TWO JSON messages. The first holds every field above
+except `chapter`, plus `outline`: the book's complete chapter list (number,
+title, subheading, approx_word_count). The second holds `chapter`. Treat
+them together as the one input object, and use `outline` to keep this
+chapter consistent with the rest of the book.
+"""
+
+# Smallest cacheable prefix per model family (tokens), plus the ~4 chars
+# per token estimate used to check it before calling the API.
+_MIN_CACHE_TOKENS = {"gemini-2.5-": 2048, "gemini-3": 4096}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+_CHARS_PER_TOKEN = 4
+
+
+def min_cache_tokens(model: str) -> int:
+    name = (model or "").rsplit("/", 1)[-1]
+    for prefix, tokens in _MIN_CACHE_TOKENS.items():
+        if name.startswith(prefix):
+            return tokens
+    return DEFAULT_MIN_CACHE_TOKENS
+
+
+def _split_input(text: str) -> Tuple[Dict[str, Any], Dict[str, Any]] | None:
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(value, dict) or PER_CHAPTER_INPUT_KEY not in value:
+        return None
+    shared = {k: v for k, v in value.items() if k != PER_CHAPTER_INPUT_KEY}
+    if not shared:
+        return None
+    return shared, {PER_CHAPTER_INPUT_KEY: value[PER_CHAPTER_INPUT_KEY]}
+
+
+class BookPrefixCache:
+    """
+    Gemini cached contents for the shared prompt prefixes of ONE book.
+    """
+
+    def __init__(self, client: Any = None, ttl_s: int = DEFAULT_TTL_S):
+        self._client = client
+        self.ttl_s = ttl_s
+        # prefix key -> task resolving to a cache name (None = don't cache)
+        self._caches: Dict[str, asyncio.Task] = {}
+        self._outline_chapters: List[Dict[str, Any]] | None = None
+        self.stats = {"created": 0, "reused": 0, "skipped_small": 0, "errors": 0, "deleted": 0}
+
+    def _get_client(self) -> Any:
+        if self._client is None:
+            from google import genai
+
+            self._client = genai.Client()
+        return self._client
+
+    # -----------------------------------------------------------------
+    # Requests
+    # -----------------------------------------------------------------
+    def set_outline(self, outline: Dict[str, Any]) -> None:
+        """
+        Record the book's completed outline; its chapters join the prefix.
+        """
+        self._outline_chapters = list(outline.get("chapters") or [])
+
+    async def apply(self, llm_request: Any) -> bool:
+        """
+        Point `llm_request` at the cached prefix (creating it on first
+        use). Returns False, leaving the request as-is, if not cacheable.
+        """
+        model = llm_request.model or ""
+        config = llm_request.config
+        contents: List[types.Content] = llm_request.contents or []
+        if not model.startswith("gemini") or config is None or config.cached_content:
+            return False
+        if not contents or contents[0].role != "user" or not contents[0].parts:
+            return False
+        if self._outline_chapters is None:
+            return False
+        split = _split_input(contents[0].parts[0].text or "")
+        if split is None:
+            return False
+        shared, rest = split
+        shared["outline"] = self._outline_chapters
+
+        shared_content = types.Content(
+            role="user", parts=[types.Part(text=json.dumps(shared, ensure_ascii=False))]
+        )
+        key = hashlib.sha256(
+            json.dumps(
+                [
+                    model,
+                    str(config.system_instruction or ""),
+                    [t.model_dump(mode="json", exclude_none=True) for t in config.tools or []],
+                    shared_content.parts[0].text,
+                ],
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()
+
+        task = self._caches.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._create(model, config, shared_content))
+            self._caches[key] = task
+        cache_name = await asyncio.shield(task)
+        if not cache_name:
+            return False
+
+        config.system_instruction = None
+        config.tools = None
+        config.tool_config = None
+        config.cached_content = cache_name
+        llm_request.contents = [
+            types.Content(
+                role="user", parts=[types.Part(text=json.dumps(rest, ensure_ascii=False))]
+            ),
+            *contents[1:],
+        ]
+        self.stats["reused"] += 1
+        return True
+
+    async def _create(
+        self, model: str, config: Any, shared_content: types.Content
+    ) -> str | None:
+        system_instruction = str(config.system_instruction or "") + CACHED_INPUT_NOTE
+        chars = len(system_instruction) + len(shared_content.parts[0].text)
+        chars += sum(len(t.model_dump_json(exclude_none=True)) for t in config.tools or [])
+        if chars // _CHARS_PER_TOKEN < min_cache_tokens(model):
+            self.stats["skipped_small"] += 1
+            return None
+        try:
+            cached = await self._get_client().aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    contents=[shared_content],
+                    system_instruction=system_instruction,
+                    tools=config.tools,
+                    tool_config=config.tool_config,
+                    ttl=f"{self.ttl_s}s",
+                    display_name="book-bot-chapter-prefix",
+                ),
+            )
+        except Exception as e:  # caching is an optimisation, never fatal
+            self.stats["errors"] += 1
+            logger.warning("Prompt prefix cache creation failed: %s", e)
+            return None
+        self.stats["created"] += 1
+        return cached.name
+
+    # -----------------------------------------------------------------
+    # Cleanup
+    # -----------------------------------------------------------------
+    async def cleanup(self) -> None:
+        """
+        Delete every cache this book created.
+        """
+        tasks, self._caches = list(self._caches.values()), {}
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        names = [
+            task.result()
+            for task in tasks
+            if task.done() and not task.cancelled() and task.exception() is None
+        ]
+        for name in filter(None, names):
+            try:
+                await self._get_client().aio.caches.delete(name=name)
+            except Exception as e:
+                logger.warning("Prompt prefix cache %s not deleted: %s", name, e)
+            else:
+                self.stats["deleted"] += 1
+
+
+# ---------------------------------------------------------------------
+# Active cache (per book) and the model callback
+# ---------------------------------------------------------------------
+
+_current_cache: contextvars.ContextVar[BookPrefixCache | None] = contextvars.ContextVar(
+    "book_agent_prefix_cache", default=None
+)
+
+
+def prompt_cache_from_env() -> BookPrefixCache | None:
+    """
+    A new BookPrefixCache if BOOK_BOT_PROMPT_CACHE=1, else None.
+    """
+    if os.environ.get("BOOK_BOT_PROMPT_CACHE") != "1":
+        return None
+    return BookPrefixCache(
+        ttl_s=int(os.environ.get("BOOK_BOT_PROMPT_CACHE_TTL_S", DEFAULT_TTL_S))
+    )
+
+
+@contextmanager
+def use_prompt_cache(cache: BookPrefixCache | None) -> Iterator[BookPrefixCache | None]:
+    """
+    Make `cache` the active prefix cache for the enclosed block (and its tasks).
+    """
+    token = _current_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _current_cache.reset(token)
+
+
+def get_current_prompt_cache() -> BookPrefixCache | None:
+    return _current_cache.get()
+
+
+async def prompt_cache_before_model(callback_context: Any, llm_request: Any) -> None:
+    """
+    before_model_callback: serve the shared prefix from the active cache.
+    """
+    cache = _current_cache.get()
+    if cache is not None:
+        await cache.apply(llm_request)
+    return None
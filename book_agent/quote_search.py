@@ -0,0 +1,291 @@
+# book_agent/quote_search.py
+"""
+Cached quote search shared by manuscript_agent and every chapter writer.
+
+`google_search` is a Gemini built-in (grounding) tool: the search runs on
+the model side, so its results cannot be intercepted or cached locally.
+Instead, writers call the function tool `search_quotes`, which:
+
+  1) normalises the query (case, punctuation, whitespace)
+  2) returns a cached result if one is fresh (TTL, bounded LRU size)
+  3) otherwise runs quote_search_agent (an agent whose ONLY tool is
+     google_search) once, even if many chapters ask concurrently
+     (single-flight), and caches its JSON result
+
+The cache can optionally persist to a JSON file so related books in later
+runs reuse earlier searches. New entries are saved in the background, at
+most once per SAVE_DEBOUNCE_S (and when the event loop shuts the save
+task down), never on the event loop itself:
+  BOOK_BOT_QUOTE_CACHE_PATH      file to load/save the cache
+  BOOK_BOT_QUOTE_CACHE_TTL_S     optional, default 24 hours
+  BOOK_BOT_QUOTE_CACHE_MAX       optional, default 2048 entries
+
+Exposed tools:
+- search_quotes_tool(query: str, num_results: int = 5) -> dict
+"""
+
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from google.adk.tools.function_tool import FunctionTool
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 2048
+
+# Delay between a cache miss and the (batched) rewrite of the persist file.
+SAVE_DEBOUNCE_S = 1.0
+
+
+def normalise_query(query: str) -> str:
+    """
+    Canonical form of a search query, so near-identical queries share
+    one cache entry: lower case, no punctuation, single spaces.
+    """
+    value = query.lower()
+    value = re.sub(r"[^\w\s']+", " ", value)
+    value = re.sub(r"\s+", " ", value)
+    return value.strip()
+
+
+class QuoteSearchCache:
+    """
+    In-process TTL + LRU cache with single-flight de-duplication and
+    optional JSON-file persistence.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        persist_path: str | None = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self.stats = {"hits": 0, "misses": 0, "shared": 0}
+
+        # key -> (stored_at, result); most recently used last.
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._dirty = False
+        self._save_task: asyncio.Task | None = None
+
+        if persist_path:
+            self._load()
+
+    # -----------------------------------------------------------------
+    # Persistence
+    # -----------------------------------------------------------------
+    def _load(self) -> None:
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        now = time.time()
+        for key, (stored_at, result) in raw.items():
+            if now - stored_at <= self.ttl_seconds:
+                self._entries[key] = (stored_at, result)
+        self._trim()
+
+    def save(self) -> None:
+        """
+        Atomically write the cache to persist_path (no-op if unset).
+        """
+        if not self.persist_path:
+            return
+        self._dirty = False
+        self._write(dict(self._entries))
+
+    def _write(self, entries: Dict[str, Any]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.persist_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _schedule_save(self) -> None:
+        if not self.persist_path:
+            return
+        self._dirty = True
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()  # synchronous caller, no loop to block
+            return
+        self._save_task = loop.create_task(self._save_soon())
+
+    async def _save_soon(self) -> None:
+        # Snapshots are taken on the loop; the file is written in a thread.
+        try:
+            await asyncio.sleep(SAVE_DEBOUNCE_S)
+            while self._dirty:
+                self._dirty = False
+                await asyncio.to_thread(self._write, dict(self._entries))
+        except asyncio.CancelledError:
+            # Loop shutting down: don't lose the last entries.
+            if self._dirty:
+                self.save()
+            raise
+
+    # -----------------------------------------------------------------
+    # Cache operations
+    # -----------------------------------------------------------------
+    def _trim(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        self._entries[key] = (time.time(), result)
+        self._entries.move_to_end(key)
+        self._trim()
+        self._schedule_save()
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Return the cached result for `key`, or run `fetch` exactly once
+        for all concurrent callers asking for the same key.
+
+        A fetch error is shared with the waiting callers. If the caller
+        running the fetch is CANCELLED instead, the waiters are not: the
+        shared fetch is dropped and they retry (one of them fetches).
+        """
+
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return cached
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self.stats["shared"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # this caller was cancelled
+                # The fetching caller was cancelled: try again.
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fetch()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an un-awaited failure is not logged.
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            self.put(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+
+# ---------------------------------------------------------------------
+# Shared cache + search backend
+# ---------------------------------------------------------------------
+
+_quote_cache: QuoteSearchCache | None = None
+
+
+def get_quote_cache() -> QuoteSearchCache:
+    """
+    Return the process-wide cache, building it from the environment once.
+    """
+    global _quote_cache
+    if _quote_cache is None:
+        _quote_cache = QuoteSearchCache(
+            ttl_seconds=float(
+                os.environ.get("BOOK_BOT_QUOTE_CACHE_TTL_S", DEFAULT_TTL_SECONDS)
+            ),
+            max_entries=int(
+                os.environ.get("BOOK_BOT_QUOTE_CACHE_MAX", DEFAULT_MAX_ENTRIES)
+            ),
+            persist_path=os.environ.get("BOOK_BOT_QUOTE_CACHE_PATH") or None,
+        )
+    return _quote_cache
+
+
+def set_quote_cache(cache: QuoteSearchCache) -> None:
+    global _quote_cache
+    _quote_cache = cache
+
+
+async def _run_search_agent(query: str, num_results: int) -> Dict[str, Any]:
+    # Imported lazily: custom_agents imports this module for the tool.
+    from .custom_agents import get_agent
+    from .workflow import _run_json_agent_async
+
+    return await _run_json_agent_async(
+        get_agent("quote_search_agent"),
+        input_obj={"query": query, "num_results": num_results},
+        user_id="quote-search-user",
+        session_id="quote-search-session",
+        # Runs inside a writer's tool call, which already holds a slot.
+        use_rate_limit_slot=False,
+        route_step="quote_search",
+    )
+
+
+# ---------------------------------------------------------------------
+# Implementation function (plain Python)
+# ---------------------------------------------------------------------
+async def search_quotes(query: str, num_results: int = 5) -> dict:
+    """
+    Searches the web for inspirational quotes and returns result snippets.
+
+    Returns {"query": str, "results": [{"title", "snippet", "url"}, ...]}.
+    """
+
+    normalised = normalise_query(query)
+    key = f"{normalised}|{num_results}"
+
+    return await get_quote_cache().get_or_fetch(
+        key,
+        lambda: _run_search_agent(normalised, num_results),
+    )
+
+
+# ---------------------------------------------------------------------
+# Tool exposure
+# ---------------------------------------------------------------------
+# ADK infers the tool name "search_quotes" from the function name.
+
+search_quotes_tool = FunctionTool(search_quotes)
@@ -0,0 +1,365 @@
+# book_agent/rate_limiter.py
+"""
+Process-wide rate limiter shared by every agent invocation.
+
+Two layers:
+
+1) Token buckets (per MODEL REQUEST)
+   - requests/minute and estimated tokens/minute budgets
+   - installed on every agent in custom_agents.py as a before_model_callback
+     (rate_limit_before_model), so tool-loop follow-up requests count too;
+     after_model_callback corrects the token estimate with real usage
+
+2) Adaptive concurrency (per AGENT INVOCATION), AIMD:
+   - additive increase: +increase_step to the limit after `limit` successes
+   - multiplicative decrease: limit *= decrease_factor on a 429 /
+     RESOURCE_EXHAUSTED error, then a bounded, backed-off retry
+   - used by workflow._run_json_agent_async (run()) and by the ParallelAgent
+     pipeline in agent.py (slot(), with the same retries and retry_delay())
+
+Configuration (environment, read once on first use):
+  BOOK_BOT_RPM                 requests per minute     (default 600)
+  BOOK_BOT_TPM                 tokens per minute       (default 2_000_000)
+  BOOK_BOT_MAX_CONCURRENCY     concurrency ceiling     (default 32)
+  BOOK_BOT_INITIAL_CONCURRENCY starting concurrency    (default 8)
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_RPM = 600
+DEFAULT_TPM = 2_000_000
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_INITIAL_CONCURRENCY = 8
+
+# Output tokens assumed for a model request before its real usage is known.
+DEFAULT_OUTPUT_TOKEN_ESTIMATE = 2048
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    True for quota errors (HTTP 429 / RESOURCE_EXHAUSTED) from the model API.
+
+    Only the error's code/status fields and the RESOURCE_EXHAUSTED status
+    name count: a bare "429" elsewhere in a message (a token count, an ID)
+    must not halve the concurrency limit.
+    """
+    for attr in ("code", "status", "status_code"):
+        value = getattr(error, attr, None)
+        if value == 429 or value == "RESOURCE_EXHAUSTED":
+            return True
+    return "RESOURCE_EXHAUSTED" in str(error)
+
+
+def estimate_tokens(text_chars: int, output_tokens: int = DEFAULT_OUTPUT_TOKEN_ESTIMATE) -> int:
+    """
+    Rough token estimate: ~4 characters per prompt token plus expected output.
+    """
+    return text_chars // 4 + output_tokens
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `per_minute` / 60 per second.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` tokens are available (0 if available now).
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """
+        Debit (positive) or credit (negative) after real usage is known.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AdaptiveRateLimiter:
+    """
+    RPM/TPM token buckets plus an AIMD-controlled concurrency limit.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_RPM,
+        tokens_per_minute: float = DEFAULT_TPM,
+        initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+        min_concurrency: int = 1,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5,
+        max_retries: int = 4,
+        base_backoff_s: float = 2.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.base_backoff_s = base_backoff_s
+
+        self.limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.in_flight = 0
+        self._successes_since_increase = 0
+        self._waiters: List[asyncio.Future] = []
+        self.stats = {
+            "requests": 0,
+            "rate_limited": 0,
+            "retries": 0,
+            "increases": 0,
+            "decreases": 0,
+        }
+
+    # -----------------------------------------------------------------
+    # Per-request budgets
+    # -----------------------------------------------------------------
+    async def acquire_request(self, estimated_tokens: int) -> None:
+        """
+        Wait until one request and `estimated_tokens` fit the budgets.
+        """
+        while True:
+            delay = max(
+                self.requests.wait_time(1),
+                self.tokens.wait_time(estimated_tokens),
+            )
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        self.requests.take(1)
+        self.tokens.take(estimated_tokens)
+        self.stats["requests"] += 1
+
+    def record_usage(self, actual_tokens: int, estimated_tokens: int) -> None:
+        """
+        Correct the token bucket once a request's real usage is known.
+        """
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    # -----------------------------------------------------------------
+    # Adaptive concurrency (AIMD)
+    # -----------------------------------------------------------------
+    def _wake_waiters(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.pop(0)
+            if not waiter.done():
+                waiter.set_result(None)
+                # Reserve the slot for the woken waiter.
+                self.in_flight += 1
+
+    def on_success(self) -> None:
+        self._successes_since_increase += 1
+        if (
+            self._successes_since_increase >= int(self.limit)
+            and self.limit < self.max_concurrency
+        ):
+            self.limit = min(self.max_concurrency, self.limit + self.increase_step)
+            self._successes_since_increase = 0
+            self.stats["increases"] += 1
+            self._wake_waiters()
+
+    def on_rate_limited(self) -> None:
+        self.stats["rate_limited"] += 1
+        self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+        self._successes_since_increase = 0
+        self.stats["decreases"] += 1
+
+    def has_headroom(self) -> bool:
+        """
+        True if one more request could start now without waiting for a
+        concurrency slot or request budget (used to gate optional work
+        such as hedged requests).
+        """
+        return (
+            self.in_flight < int(self.limit)
+            and not self._waiters
+            and self.requests.wait_time(1) <= 0
+        )
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold one concurrency slot for an agent invocation.
+
+        Successful exits count towards additive increase; rate-limit errors
+        trigger multiplicative decrease (the error is re-raised).
+        """
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    self.in_flight -= 1
+                    self._wake_waiters()
+                raise
+
+        try:
+            yield
+        except BaseException as e:
+            if isinstance(e, Exception) and is_rate_limit_error(e):
+                self.on_rate_limited()
+            raise
+        else:
+            self.on_success()
+        finally:
+            self.in_flight -= 1
+            self._wake_waiters()
+
+    async def run(self, call: Callable[[], Awaitable[T]], use_slot: bool = True) -> T:
+        """
+        Run `call()` inside a slot, retrying rate-limit errors with
+        exponential backoff + jitter up to max_retries times.
+
+        use_slot=False skips concurrency gating (for invocations nested
+        inside one that already holds a slot, e.g. tool-driven searches).
+        """
+        attempt = 0
+        while True:
+            try:
+                if use_slot:
+                    async with self.slot():
+                        return await call()
+                return await call()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                if not use_slot:
+                    self.on_rate_limited()
+                attempt += 1
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.retry_delay(attempt))
+
+    def retry_delay(self, attempt: int) -> float:
+        """
+        Backoff before retry number `attempt` (1-based): exponential with
+        jitter, as used by run().
+        """
+        backoff = self.base_backoff_s * (2 ** (attempt - 1))
+        return backoff * (0.5 + random.random())
+
+
+# ---------------------------------------------------------------------
+# Process-wide limiter
+# ---------------------------------------------------------------------
+
+_rate_limiter: AdaptiveRateLimiter | None = None
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """
+    Return the shared limiter, building it from the environment once.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = rate_limiter_from_env()
+    return _rate_limiter
+
+
+def rate_limiter_from_env(budget_share: float = 1.0) -> AdaptiveRateLimiter:
+    """
+    Build a limiter from the environment with `budget_share` of the
+    BOOK_BOT_RPM / BOOK_BOT_TPM budgets (e.g. 1/N for each of N processes
+    sharing one quota).
+    """
+    return AdaptiveRateLimiter(
+        requests_per_minute=float(os.environ.get("BOOK_BOT_RPM", DEFAULT_RPM)) * budget_share,
+        tokens_per_minute=float(os.environ.get("BOOK_BOT_TPM", DEFAULT_TPM)) * budget_share,
+        initial_concurrency=int(
+            os.environ.get("BOOK_BOT_INITIAL_CONCURRENCY", DEFAULT_INITIAL_CONCURRENCY)
+        ),
+        max_concurrency=int(
+            os.environ.get("BOOK_BOT_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+        ),
+    )
+
+
+def set_rate_limiter(limiter: AdaptiveRateLimiter) -> None:
+    global _rate_limiter
+    _rate_limiter = limiter
+
+
+# ---------------------------------------------------------------------
+# ADK model callbacks (installed on every agent in custom_agents.py)
+# ---------------------------------------------------------------------
+
+# (invocation_id, agent_name) -> token estimate of the request in flight.
+# Requests that fail never reach after_model_callback, so the map is
+# bounded: the oldest estimates are dropped (and never corrected) first.
+MAX_PENDING_ESTIMATES = 1024
+_pending_estimates: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+
+
+def _request_chars(llm_request: Any) -> int:
+    chars = len(str(getattr(llm_request.config, "system_instruction", "") or ""))
+    for content in llm_request.contents or []:
+        for part in content.parts or []:
+            if part.text:
+                chars += len(part.text)
+            elif part.function_response is not None:
+                chars += len(str(part.function_response.response))
+    return chars
+
+
+async def rate_limit_before_model(callback_context: Any, llm_request: Any) -> None:
+    """
+    before_model_callback: wait for RPM/TPM budget before each model request.
+    """
+    estimated = estimate_tokens(_request_chars(llm_request))
+    await get_rate_limiter().acquire_request(estimated)
+    key = (callback_context.invocation_id, callback_context.agent_name)
+    _pending_estimates.pop(key, None)
+    _pending_estimates[key] = estimated
+    while len(_pending_estimates) > MAX_PENDING_ESTIMATES:
+        _pending_estimates.popitem(last=False)
+    return None
+
+
+def rate_limit_after_model(callback_context: Any, llm_response: Any) -> None:
+    """
+    after_model_callback: replace the token estimate with real usage.
+    """
+    usage = getattr(llm_response, "usage_metadata", None)
+    if usage is None or not usage.total_token_count:
+        # Partial (streamed) chunks carry no usage; wait for the last one.
+        return None
+    key = (callback_context.invocation_id, callback_context.agent_name)
+    estimated = _pending_estimates.pop(key, None)
+    if estimated:
+        get_rate_limiter().record_usage(usage.total_token_count, estimated)
+    return None
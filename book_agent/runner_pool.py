@@ -0,0 +1,84 @@
+# book_agent/runner_pool.py
+"""
+Reusable InMemoryRunner + session pool.
+
+Building an InMemoryRunner (and its InMemorySessionService) for every agent
+step of every book is pure overhead: the runner only depends on the agent.
+RunnerPool keeps ONE runner per agent for the lifetime of the process and
+hands out short-lived sessions with unique IDs, deleting each session as
+soon as its run finishes so nothing accumulates across books.
+"""
+
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Tuple
+
+from google.adk.runners import InMemoryRunner
+
+
+class RunnerPool:
+    """
+    One InMemoryRunner per agent, shared across steps and books.
+    """
+
+    def __init__(self, app_name: str):
+        self.app_name = app_name
+        # Keyed by id(agent); the agent is kept alongside so the id stays valid.
+        self._runners: Dict[int, Tuple[object, InMemoryRunner]] = {}
+        self.stats = {
+            "runners_created": 0,
+            "sessions_created": 0,
+            "sessions_deleted": 0,
+        }
+
+    def get_runner(self, agent) -> InMemoryRunner:
+        """
+        Return the pooled runner for `agent`, creating it on first use.
+        """
+        entry = self._runners.get(id(agent))
+        if entry is None or entry[0] is not agent:
+            runner = InMemoryRunner(agent=agent, app_name=self.app_name)
+            self._runners[id(agent)] = (agent, runner)
+            self.stats["runners_created"] += 1
+            return runner
+        return entry[1]
+
+    @asynccontextmanager
+    async def session(
+        self,
+        agent,
+        user_id: str,
+        session_prefix: str,
+    ) -> AsyncIterator[Tuple[InMemoryRunner, str]]:
+        """
+        Yield (runner, session_id) for one agent run.
+
+        The session ID is `session_prefix` plus a random suffix so concurrent
+        runs of the same step (e.g. two books) never collide. The session is
+        deleted when the block exits, even on error.
+        """
+        runner = self.get_runner(agent)
+        session_service = runner.session_service
+        session_id = f"{session_prefix}-{uuid.uuid4().hex[:12]}"
+
+        await session_service.create_session(
+            app_name=self.app_name,
+            user_id=user_id,
+            session_id=session_id,
+        )
+        self.stats["sessions_created"] += 1
+        try:
+            yield runner, session_id
+        finally:
+            await session_service.delete_session(
+                app_name=self.app_name,
+                user_id=user_id,
+                session_id=session_id,
+            )
+            self.stats["sessions_deleted"] += 1
+
+    def clear(self) -> None:
+        """
+        Drop every pooled runner (e.g. after agents have been rebuilt).
+        """
+        self._runners.clear()
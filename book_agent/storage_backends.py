@@ -0,0 +1,350 @@
+# book_agent/storage_backends.py
+"""
+Storage backends behind the save_*_to_gcs tools in tools.py.
+
+Backends:
+- GCSBackend               Google Cloud Storage (one shared, connection-
+                           pooled client)
+- LocalFilesystemBackend   files under a local directory; each object is
+                           written to a temp file and atomically renamed,
+                           and fsync is batched (every `fsync_every` writes
+                           and on flush())
+- InMemoryBackend          a dict, for tests and benchmarks
+
+The process-wide backend is chosen by configuration:
+  BOOK_BOT_STORAGE_BACKEND   "gcs" (default), "local" or "memory"
+  BOOK_BOT_GCS_BUCKET        bucket for "gcs"           (default adk-book-bot)
+  BOOK_BOT_STORAGE_DIR       root directory for "local" (default ./book_output)
+  BOOK_BOT_FSYNC_EVERY       writes per batched fsync   (default 32)
+
+High-volume batch runs can write locally and push everything to a bucket
+later with sync_local_to_gcs, or:
+    python -m book_agent.storage_backends ./book_output --bucket adk-book-bot
+"""
+
+import abc
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    # Imported on first use (GCSBackend._get_client): processes that write
+    # locally or to memory never pay for google.cloud.storage.
+    from google.cloud import storage
+
+DEFAULT_BUCKET_NAME = "adk-book-bot"
+DEFAULT_LOCAL_DIR = "book_output"
+DEFAULT_FSYNC_EVERY = 32
+DEFAULT_POOL_SIZE = 8
+
+_CONTENT_TYPES = {".md": "text/markdown", ".json": "application/json"}
+GZIP_SUFFIX = ".gz"
+
+
+class StorageBackend(abc.ABC):
+    """
+    Minimal object store: write bytes/text under an object name.
+    """
+
+    # Short name reported as "bucket" in tool results.
+    location: str = ""
+
+    @abc.abstractmethod
+    def put_object(
+        self,
+        object_name: str,
+        data: str | bytes,
+        content_type: str,
+        content_encoding: str | None = None,
+    ) -> str:
+        """
+        Store `data` as `object_name`; return the object's URI.
+
+        content_encoding (e.g. "gzip") describes bytes that are already
+        encoded; backends that keep metadata record it with the object.
+        """
+
+    def flush(self) -> None:
+        """
+        Make every write so far durable (no-op unless the backend batches).
+        """
+
+
+# ---------------------------------------------------------------------
+# Google Cloud Storage
+# ---------------------------------------------------------------------
+
+def _size_connection_pool(client: "storage.Client", size: int) -> None:
+    """
+    Let `size` uploads share the client's HTTP session without queueing
+    for (or discarding) connections; requests defaults to 10 per host.
+    """
+    http = getattr(client, "_http", None)
+    if http is None or not hasattr(http, "mount"):
+        return
+    from requests.adapters import HTTPAdapter
+
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+
+
+class GCSBackend(StorageBackend):
+    """
+    Objects in a GCS bucket, uploaded through one shared client.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str = DEFAULT_BUCKET_NAME,
+        client: "storage.Client | None" = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+    ):
+        self.bucket_name = bucket_name
+        self.location = bucket_name
+        self.pool_size = pool_size
+        self._client = client
+        self._lock = threading.Lock()
+
+    def _get_client(self) -> "storage.Client":
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import storage
+
+                    client = storage.Client()
+                    _size_connection_pool(client, self.pool_size)
+                    self._client = client
+        return self._client
+
+    def put_object(
+        self,
+        object_name: str,
+        data: str | bytes,
+        content_type: str,
+        content_encoding: str | None = None,
+    ) -> str:
+        blob = self._get_client().bucket(self.bucket_name).blob(object_name)
+        if content_encoding:
+            # GCS serves it decompressed to clients that don't accept gzip.
+            blob.content_encoding = content_encoding
+        blob.upload_from_string(data, content_type=content_type)
+        return f"gs://{self.bucket_name}/{object_name}"
+
+
+# ---------------------------------------------------------------------
+# Local filesystem
+# ---------------------------------------------------------------------
+
+class LocalFilesystemBackend(StorageBackend):
+    """
+    Objects as files under `root`, written atomically with batched fsync.
+
+    A crash never leaves a half-written object (temp file + rename); only
+    writes since the last fsync batch can be lost on power failure.
+
+    gzip-encoded objects are stored as "<object_name>.gz" so that
+    sync_local_to_gcs can restore their Content-Encoding.
+    """
+
+    def __init__(self, root: str = DEFAULT_LOCAL_DIR, fsync_every: int = DEFAULT_FSYNC_EVERY):
+        self.root = os.path.abspath(root)
+        self.location = self.root
+        self.fsync_every = max(1, fsync_every)
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+
+    def path_for(self, object_name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, object_name))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Object name {object_name!r} escapes {self.root}")
+        return path
+
+    def put_object(
+        self,
+        object_name: str,
+        data: str | bytes,
+        content_type: str,
+        content_encoding: str | None = None,
+    ) -> str:
+        if content_encoding == "gzip":
+            object_name += GZIP_SUFFIX
+        path = self.path_for(object_name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        payload = data.encode("utf-8") if isinstance(data, str) else data
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._pending.append(path)
+            if len(self._pending) >= self.fsync_every:
+                self._flush_locked()
+        return f"file://{path}"
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        directories = set()
+        for path in self._pending:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            directories.add(os.path.dirname(path))
+        # Persist the renames themselves.
+        for directory in directories:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._pending.clear()
+
+    def object_names(self) -> List[str]:
+        names = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                names.append(os.path.relpath(path, self.root).replace(os.sep, "/"))
+        return sorted(names)
+
+
+# ---------------------------------------------------------------------
+# In memory
+# ---------------------------------------------------------------------
+
+class InMemoryBackend(StorageBackend):
+    """
+    Objects kept in a dict: {object_name: (data, content_type, content_encoding)}.
+    """
+
+    def __init__(self, name: str = "memory"):
+        self.location = name
+        self.objects: Dict[str, tuple[str | bytes, str, str | None]] = {}
+        self._lock = threading.Lock()
+
+    def put_object(
+        self,
+        object_name: str,
+        data: str | bytes,
+        content_type: str,
+        content_encoding: str | None = None,
+    ) -> str:
+        with self._lock:
+            self.objects[object_name] = (data, content_type, content_encoding)
+        return f"memory://{self.location}/{object_name}"
+
+
+# ---------------------------------------------------------------------
+# Bulk sync: local -> GCS
+# ---------------------------------------------------------------------
+
+def sync_local_to_gcs(
+    source: LocalFilesystemBackend,
+    target: GCSBackend,
+    max_workers: int = DEFAULT_POOL_SIZE,
+) -> List[str]:
+    """
+    Upload every object under source.root to `target` under the same
+    object name, `max_workers` at a time. Returns the uploaded URIs.
+    """
+
+    def upload(object_name: str) -> str:
+        path = source.path_for(object_name)
+        content_encoding = None
+        if object_name.endswith(GZIP_SUFFIX):
+            object_name = object_name[: -len(GZIP_SUFFIX)]
+            content_encoding = "gzip"
+        content_type = _CONTENT_TYPES.get(
+            os.path.splitext(object_name)[1], "application/octet-stream"
+        )
+        with open(path, "rb") as f:
+            return target.put_object(
+                object_name, f.read(), content_type, content_encoding=content_encoding
+            )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(upload, source.object_names()))
+
+
+# ---------------------------------------------------------------------
+# Process-wide backend
+# ---------------------------------------------------------------------
+
+_backend: StorageBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def storage_backend_from_env() -> StorageBackend:
+    kind = os.environ.get("BOOK_BOT_STORAGE_BACKEND", "gcs").lower()
+    if kind == "gcs":
+        return GCSBackend(
+            bucket_name=os.environ.get("BOOK_BOT_GCS_BUCKET", DEFAULT_BUCKET_NAME),
+            pool_size=int(os.environ.get("BOOK_BOT_STORAGE_THREADS", DEFAULT_POOL_SIZE)),
+        )
+    if kind == "local":
+        return LocalFilesystemBackend(
+            root=os.environ.get("BOOK_BOT_STORAGE_DIR", DEFAULT_LOCAL_DIR),
+            fsync_every=int(os.environ.get("BOOK_BOT_FSYNC_EVERY", DEFAULT_FSYNC_EVERY)),
+        )
+    if kind == "memory":
+        return InMemoryBackend()
+    raise ValueError(f"Unknown BOOK_BOT_STORAGE_BACKEND {kind!r}")
+
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Return the shared backend, building it from the environment once.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = storage_backend_from_env()
+    return _backend
+
+
+def set_storage_backend(backend: StorageBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Upload a local book output directory to GCS.")
+    parser.add_argument("source_dir", help="root of a LocalFilesystemBackend")
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET_NAME)
+    parser.add_argument("--workers", type=int, default=DEFAULT_POOL_SIZE)
+    args = parser.parse_args()
+
+    uris = sync_local_to_gcs(
+        LocalFilesystemBackend(args.source_dir),
+        GCSBackend(args.bucket, pool_size=args.workers),
+        max_workers=args.workers,
+    )
+    print(json.dumps({"uploaded": len(uris)}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
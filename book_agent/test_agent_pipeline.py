@@ -0,0 +1,48 @@
+# book_agent/test_agent_pipeline.py
+"""
+Regression checks for the ParallelAgent pipeline helpers in agent.py.
+
+Run with pytest, or directly:
+    python -m book_agent.test_agent_pipeline
+"""
+import asyncio
+
+from .agent import _merge_agent_runs
+from .rate_limiter import AdaptiveRateLimiter
+
+
+def test_failed_run_releases_sibling_slots() -> None:
+    # One writer fails while its siblings are paused after an event; every
+    # slot must be free by the time the error reaches the caller (before
+    # any garbage collection of the abandoned runs).
+    limiter = AdaptiveRateLimiter(initial_concurrency=3, max_concurrency=3)
+
+    async def writer(fail: bool):
+        async with limiter.slot():
+            yield "event"
+            if fail:
+                raise RuntimeError("injected failure")
+            await asyncio.sleep(3600)
+            yield "never"
+
+    async def consume() -> None:
+        async for _ in _merge_agent_runs([writer(False), writer(True), writer(False)]):
+            pass
+
+    async def main() -> None:
+        try:
+            await consume()
+        except RuntimeError as e:
+            assert str(e) == "injected failure"
+        else:
+            raise AssertionError("the injected failure was not raised")
+        assert limiter.in_flight == 0, limiter.in_flight
+        # A new invocation gets a slot straight away.
+        await asyncio.wait_for(limiter.slot().__aenter__(), timeout=1)
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    test_failed_run_releases_sibling_slots()
+    print("ok")
@@ -1,30 +1,65 @@
 # book_agent/tools.py
 """
-Function tools for saving book data to Google Cloud Storage.
+Function tools for saving book data to the configured storage backend
+(Google Cloud Storage by default; see storage_backends.py).
 
 Exposed tools:
 - save_markdown_to_gcs_tool(book_title: str, content_markdown: str) -> dict
 - save_metadata_to_gcs_tool(book_title: str, metadata: dict) -> dict
+- save_book_to_gcs_tool(working_title: str, full_book_markdown: str, metadata: dict) -> dict
+
+The plain Python functions behind each tool are also importable, so the
+deterministic workflow can call them directly without an LLM in the loop.
+
+Async variants (save_markdown_to_gcs_async, save_metadata_to_gcs_async,
+save_book_to_gcs_async) run the blocking uploads on a bounded thread pool
+so they never stall the event loop:
+  BOOK_BOT_STORAGE_THREADS   upload threads (default 8); the GCS backend
+                             sizes its HTTP connection pool to match
+
+Per-chapter layout (save_book_chapters_async): every chapter is its own
+object, uploaded in parallel and retried on its own, optionally
+gzip-encoded, followed by an ordered manifest (see "Per-chapter layout"
+below). The workflow uses it when configured:
+  BOOK_BOT_STORAGE_LAYOUT    "single" (default) or "chapters"
+  BOOK_BOT_STORAGE_GZIP      "1" to gzip chapter objects
+  BOOK_BOT_STORE_MANUSCRIPT  "0" to skip the assembled manuscript object
 """
 
+import asyncio
+import functools
+import gzip
+import hashlib
 import json
+import os
 import re
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from google.cloud import storage
 from google.adk.tools.function_tool import FunctionTool
 
-BUCKET_NAME = "adk-book-bot"
+from .storage_backends import get_storage_backend
 
-_storage_client = None
+DEFAULT_STORAGE_THREADS = 8
+STORAGE_THREADS = int(os.environ.get("BOOK_BOT_STORAGE_THREADS", DEFAULT_STORAGE_THREADS))
 
+STORAGE_LAYOUT = os.environ.get("BOOK_BOT_STORAGE_LAYOUT", "single")
+STORAGE_GZIP = os.environ.get("BOOK_BOT_STORAGE_GZIP") == "1"
+STORE_MANUSCRIPT = os.environ.get("BOOK_BOT_STORE_MANUSCRIPT", "1") != "0"
 
-def _get_client() -> storage.Client:
-    global _storage_client
-    if _storage_client is None:
-        _storage_client = storage.Client()
-    return _storage_client
+# Bounded pool shared by every upload in the process.
+_upload_executor = ThreadPoolExecutor(
+    max_workers=STORAGE_THREADS, thread_name_prefix="storage-upload"
+)
+
+
+async def _run_upload(func, **kwargs) -> dict:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _upload_executor, functools.partial(func, **kwargs)
+    )
 
 
 def _safe_title(title: str) -> str:
@@ -40,11 +75,10 @@ def _safe_title(title: str) -> str:
 # ---------------------------------------------------------------------
 def save_markdown_to_gcs(book_title: str, content_markdown: str) -> dict:
     """
-    Saves the full book manuscript to Google Cloud Storage and returns URI info.
+    Saves the full book manuscript to storage and returns URI info.
     """
 
-    client = _get_client()
-    bucket = client.bucket(BUCKET_NAME)
+    backend = get_storage_backend()
 
     folder = _safe_title(book_title)
     timestamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
@@ -52,23 +86,21 @@ def save_markdown_to_gcs(book_title: str, content_markdown: str) -> dict:
 
     object_name = f"{folder}/manuscript-{timestamp}-{uniq}.md"
 
-    blob = bucket.blob(object_name)
-    blob.upload_from_string(content_markdown, content_type="text/markdown")
+    uri = backend.put_object(object_name, content_markdown, content_type="text/markdown")
 
     return {
-        "gcs_uri": f"gs://{BUCKET_NAME}/{object_name}",
-        "bucket": BUCKET_NAME,
+        "gcs_uri": uri,
+        "bucket": backend.location,
         "object_name": object_name,
     }
 
 
 def save_metadata_to_gcs(book_title: str, metadata: dict) -> dict:
     """
-    Saves a metadata JSON file to Google Cloud Storage.
+    Saves a metadata JSON file to storage.
     """
 
-    client = _get_client()
-    bucket = client.bucket(BUCKET_NAME)
+    backend = get_storage_backend()
 
     folder = _safe_title(book_title)
     timestamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
@@ -76,19 +108,37 @@ def save_metadata_to_gcs(book_title: str, metadata: dict) -> dict:
 
     object_name = f"{folder}/metadata-{timestamp}-{uniq}.json"
 
-    blob = bucket.blob(object_name)
-    blob.upload_from_string(
+    uri = backend.put_object(
+        object_name,
         json.dumps(metadata, ensure_ascii=False, indent=2),
         content_type="application/json",
     )
 
     return {
-        "gcs_uri": f"gs://{BUCKET_NAME}/{object_name}",
-        "bucket": BUCKET_NAME,
+        "gcs_uri": uri,
+        "bucket": backend.location,
         "object_name": object_name,
     }
 
 
+async def save_markdown_to_gcs_async(book_title: str, content_markdown: str) -> dict:
+    """
+    save_markdown_to_gcs on the shared upload thread pool.
+    """
+    return await _run_upload(
+        save_markdown_to_gcs, book_title=book_title, content_markdown=content_markdown
+    )
+
+
+async def save_metadata_to_gcs_async(book_title: str, metadata: dict) -> dict:
+    """
+    save_metadata_to_gcs on the shared upload thread pool.
+    """
+    return await _run_upload(
+        save_metadata_to_gcs, book_title=book_title, metadata=metadata
+    )
+
+
 # ---------------------------------------------------------------------
 # Tool exposure (single tool object per function)
 # ---------------------------------------------------------------------
@@ -103,30 +153,175 @@ def save_book_to_gcs(working_title: str, full_book_markdown: str, metadata: dict
     """
     Composite helper that:
       1) Saves the manuscript markdown
-      2) Saves the metadata JSON
+      2) Saves the metadata JSON (concurrently with 1, on the upload pool)
       3) Returns both GCS URIs in a simple JSON object
     """
 
-    # 1) Save manuscript (call the plain Python function directly)
-    manuscript_result = save_markdown_to_gcs(
+    manuscript_future = _upload_executor.submit(
+        save_markdown_to_gcs,
         book_title=working_title,
         content_markdown=full_book_markdown,
     )
-    manuscript_uri = manuscript_result["gcs_uri"]
-
-    # 2) Save metadata (call the plain Python function directly)
-    metadata_result = save_metadata_to_gcs(
+    metadata_future = _upload_executor.submit(
+        save_metadata_to_gcs,
         book_title=working_title,
         metadata=metadata,
     )
-    metadata_uri = metadata_result["gcs_uri"]
 
-    # 3) Final payload
     return {
-        "manuscript_gcs_uri": manuscript_uri,
-        "metadata_gcs_uri": metadata_uri,
+        "manuscript_gcs_uri": manuscript_future.result()["gcs_uri"],
+        "metadata_gcs_uri": metadata_future.result()["gcs_uri"],
+    }
+
+
+async def save_book_to_gcs_async(
+    working_title: str, full_book_markdown: str, metadata: dict
+) -> dict:
+    """
+    save_book_to_gcs without blocking the event loop: both uploads run
+    concurrently on the shared upload thread pool.
+    """
+
+    manuscript_result, metadata_result = await asyncio.gather(
+        save_markdown_to_gcs_async(working_title, full_book_markdown),
+        save_metadata_to_gcs_async(working_title, metadata),
+    )
+    return {
+        "manuscript_gcs_uri": manuscript_result["gcs_uri"],
+        "metadata_gcs_uri": metadata_result["gcs_uri"],
     }
 
 
-# Expose as a tool the LLM can call
-save_book_to_gcs = FunctionTool(save_book_to_gcs)
\ No newline at end of file
+# Expose as a tool the LLM can call. The plain function above keeps its name
+# so ADK infers the tool name "save_book_to_gcs".
+save_book_to_gcs_tool = FunctionTool(save_book_to_gcs)
+
+
+# ---------------------------------------------------------------------
+# Per-chapter layout
+# ---------------------------------------------------------------------
+# <title>/<timestamp>-<uniq>/
+#     chapters/001.md         one object per chapter (".gz" suffix on local
+#     chapters/002.md         backends when gzip-encoded)
+#     ...
+#     metadata.json
+#     manuscript.md           only when full_book_markdown is given
+#     manifest.json           written LAST, once every object above exists
+
+CHAPTER_UPLOAD_ATTEMPTS = 3
+CHAPTER_RETRY_BASE_DELAY_S = 0.5
+
+
+def _put_with_retries(
+    object_name: str,
+    data: str | bytes,
+    content_type: str,
+    content_encoding: str | None = None,
+    attempts: int = CHAPTER_UPLOAD_ATTEMPTS,
+) -> str:
+    """
+    put_object with exponential backoff; runs on an upload thread.
+    """
+    backend = get_storage_backend()
+    for attempt in range(1, attempts + 1):
+        try:
+            return backend.put_object(
+                object_name, data, content_type, content_encoding=content_encoding
+            )
+        except Exception:
+            if attempt == attempts:
+                raise
+            time.sleep(CHAPTER_RETRY_BASE_DELAY_S * (2 ** (attempt - 1)))
+    raise AssertionError("unreachable")
+
+
+async def save_book_chapters_async(
+    working_title: str,
+    chapters: list,
+    metadata: dict,
+    front_matter_markdown: dict | None = None,
+    full_book_markdown: str | None = None,
+    gzip_chapters: bool = False,
+) -> dict:
+    """
+    Save a book as one object per chapter plus an ordered manifest.
+
+    Chapters, metadata and (if given) the assembled manuscript upload in
+    parallel on the shared upload pool; a failed chapter is retried on its
+    own. Returns {"manifest_gcs_uri", "metadata_gcs_uri",
+    "chapter_gcs_uris", and "manuscript_gcs_uri" if it was saved}.
+    """
+
+    prefix = (
+        f"{_safe_title(working_title)}/"
+        f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    )
+    ordered = sorted(chapters, key=lambda c: c.get("number") or 0)
+
+    async def upload_chapter(chapter: dict) -> dict:
+        number = chapter.get("number") or 0
+        text = (chapter.get("content_markdown") or "").strip() + "\n"
+        raw = text.encode("utf-8")
+        data = gzip.compress(raw, mtime=0) if gzip_chapters else raw
+        object_name = f"{prefix}/chapters/{number:03d}.md"
+        uri = await _run_upload(
+            _put_with_retries,
+            object_name=object_name,
+            data=data,
+            content_type="text/markdown; charset=utf-8",
+            content_encoding="gzip" if gzip_chapters else None,
+        )
+        return {
+            "number": number,
+            "title": chapter.get("title", ""),
+            "uri": uri,
+            "bytes": len(data),
+            "sha256": hashlib.sha256(raw).hexdigest(),
+            "content_encoding": "gzip" if gzip_chapters else None,
+        }
+
+    async def upload_document(name: str, data: str, content_type: str) -> str:
+        return await _run_upload(
+            _put_with_retries,
+            object_name=f"{prefix}/{name}",
+            data=data,
+            content_type=content_type,
+        )
+
+    metadata_upload = upload_document(
+        "metadata.json",
+        json.dumps(metadata, ensure_ascii=False, indent=2),
+        "application/json",
+    )
+    manuscript_upload = (
+        upload_document("manuscript.md", full_book_markdown, "text/markdown")
+        if full_book_markdown
+        else asyncio.sleep(0, result=None)
+    )
+    metadata_uri, manuscript_uri, *chapter_entries = await asyncio.gather(
+        metadata_upload,
+        manuscript_upload,
+        *(upload_chapter(c) for c in ordered),
+    )
+
+    manifest = {
+        "working_title": working_title,
+        "front_matter_markdown": front_matter_markdown or {},
+        "chapters": chapter_entries,
+        "metadata_uri": metadata_uri,
+        "manuscript_uri": manuscript_uri,
+    }
+    manifest_uri = await upload_document(
+        "manifest.json",
+        json.dumps(manifest, ensure_ascii=False, indent=2),
+        "application/json",
+    )
+
+    result = {
+        "manifest_gcs_uri": manifest_uri,
+        "metadata_gcs_uri": metadata_uri,
+        "chapter_gcs_uris": [entry["uri"] for entry in chapter_entries],
+    }
+    if manuscript_uri:
+        result["manuscript_gcs_uri"] = manuscript_uri
+    return result
@@ -0,0 +1,220 @@
+# book_agent/tracing.py
+"""
+Per-run instrumentation for book generation.
+
+A RunTrace collects one StepTrace per agent step (and per direct tool
+step) with:
+  - wall time and time to first event (TTFT)
+  - prompt / output token counts from the model responses' usage metadata
+  - every tool call (e.g. search_quotes, save_book_to_gcs) with its duration
+  - JSON cleanup/parse time
+
+The trace is plain JSON (RunTrace.to_dict / write_json). If the
+`opentelemetry` package is installed and the trace is created with
+otel=True (or BOOK_BOT_OTEL=1), each step is also emitted as a span.
+
+The active trace is carried in a context variable so nested helpers
+(workflow steps, quote searches, parallel chapter writers) record into it
+without threading it through every call.
+"""
+
+import contextvars
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # optional dependency
+    otel_trace = None
+
+
+_current_trace: contextvars.ContextVar["RunTrace | None"] = contextvars.ContextVar(
+    "book_agent_run_trace", default=None
+)
+
+
+def get_current_trace() -> "RunTrace | None":
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace: "RunTrace") -> Iterator["RunTrace"]:
+    """
+    Make `trace` the active trace for the enclosed block (and its tasks).
+    """
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+class StepTrace:
+    """
+    Timing and usage for ONE agent (or direct tool) step.
+    """
+
+    def __init__(self, run: "RunTrace", name: str, attrs: Dict[str, Any]):
+        self.run = run
+        self.name = name
+        self.attrs = dict(attrs)
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.wall_s: float | None = None
+        self.ttft_s: float | None = None
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.json_cleanup_s: float | None = None
+        self.tool_calls: List[Dict[str, Any]] = []
+        self.status = "running"
+        self.error: str | None = None
+        self._open_tools: Dict[str, tuple[str, float]] = {}
+        self._span = run._start_span(name, self.attrs)
+
+    def on_event(self, event: Any) -> None:
+        """
+        Record TTFT, token usage and tool-call timing from an ADK Event.
+        """
+        now = time.perf_counter()
+        if self.ttft_s is None:
+            self.ttft_s = now - self._t0
+
+        usage = getattr(event, "usage_metadata", None)
+        # Partial (streamed) chunks carry no usage; final responses do.
+        if usage is not None and not getattr(event, "partial", False):
+            self.prompt_tokens += usage.prompt_token_count or 0
+            self.output_tokens += usage.candidates_token_count or 0
+
+        for call in event.get_function_calls() or []:
+            self._open_tools[call.id or call.name] = (call.name, now)
+        for response in event.get_function_responses() or []:
+            name, started = self._open_tools.pop(
+                response.id or response.name, (response.name, now)
+            )
+            self.record_tool_call(name, now - started)
+
+    def record_tool_call(self, name: str, duration_s: float) -> None:
+        self.tool_calls.append({"name": name, "duration_s": round(duration_s, 4)})
+
+    @contextmanager
+    def time_json_cleanup(self) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.json_cleanup_s = (self.json_cleanup_s or 0.0) + time.perf_counter() - t0
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.wall_s = time.perf_counter() - self._t0
+        self.status = "error" if error else "ok"
+        self.error = repr(error) if error else None
+        self.run._end_span(self._span, self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        def r(value: float | None) -> float | None:
+            return None if value is None else round(value, 4)
+
+        return {
+            "name": self.name,
+            **self.attrs,
+            "started_at": self.started_at,
+            "wall_s": r(self.wall_s),
+            "ttft_s": r(self.ttft_s),
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "tool_calls": self.tool_calls,
+            "json_cleanup_s": r(self.json_cleanup_s),
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class RunTrace:
+    """
+    Structured trace of one book run.
+    """
+
+    def __init__(self, run_id: str | None = None, otel: bool | None = None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.wall_s: float | None = None
+        self.steps: List[StepTrace] = []
+        if otel is None:
+            otel = os.environ.get("BOOK_BOT_OTEL") == "1"
+        self._tracer = (
+            otel_trace.get_tracer("book_agent") if otel and otel_trace else None
+        )
+
+    # -----------------------------------------------------------------
+    # Steps
+    # -----------------------------------------------------------------
+    def start_step(self, name: str, **attrs: Any) -> StepTrace:
+        step = StepTrace(self, name, attrs)
+        self.steps.append(step)
+        return step
+
+    @contextmanager
+    def step(self, name: str, **attrs: Any) -> Iterator[StepTrace]:
+        step = self.start_step(name, **attrs)
+        try:
+            yield step
+        except BaseException as e:
+            step.finish(e)
+            raise
+        else:
+            step.finish()
+
+    def finish(self) -> None:
+        self.wall_s = time.perf_counter() - self._t0
+
+    # -----------------------------------------------------------------
+    # OpenTelemetry (optional)
+    # -----------------------------------------------------------------
+    def _start_span(self, name: str, attrs: Dict[str, Any]) -> Any:
+        if self._tracer is None:
+            return None
+        span = self._tracer.start_span(name)
+        span.set_attribute("book.run_id", self.run_id)
+        for key, value in attrs.items():
+            if isinstance(value, (str, int, float, bool)):
+                span.set_attribute(f"book.{key}", value)
+        return span
+
+    def _end_span(self, span: Any, step: StepTrace) -> None:
+        if span is None:
+            return
+        span.set_attribute("book.ttft_s", step.ttft_s or 0.0)
+        span.set_attribute("book.prompt_tokens", step.prompt_tokens)
+        span.set_attribute("book.output_tokens", step.output_tokens)
+        span.set_attribute("book.tool_calls", len(step.tool_calls))
+        span.set_attribute("book.status", step.status)
+        span.end()
+
+    # -----------------------------------------------------------------
+    # Output
+    # -----------------------------------------------------------------
+    def to_dict(self) -> Dict[str, Any]:
+        steps = [s.to_dict() for s in self.steps]
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "wall_s": None if self.wall_s is None else round(self.wall_s, 4),
+            "totals": {
+                "steps": len(steps),
+                "prompt_tokens": sum(s["prompt_tokens"] for s in steps),
+                "output_tokens": sum(s["output_tokens"] for s in steps),
+                "tool_calls": sum(len(s["tool_calls"]) for s in steps),
+            },
+            "steps": steps,
+        }
+
+    def write_json(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,158 @@
+# book_agent/validation.py
+"""
+Local validation of structured agent output.
+
+Chapter checks let the workflow re-request ONLY the chapters that are
+missing, mis-numbered or malformed, instead of regenerating a whole book.
+
+Outline checks enforce the OUTLINE_INSTRUCTION rules locally (sequential
+numbering, distinct titles, at most 25 chapters) and report how many
+chapters are still needed to reach min_chapters.
+"""
+
+from typing import Any, Dict, List
+
+# Fields every manuscript chapter object must carry (see CHAPTER_INSTRUCTION).
+REQUIRED_CHAPTER_TEXT_FIELDS = ("title", "content_markdown")
+
+
+def _as_int(value: Any) -> int | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
+def validate_chapter(chapter: Any, expected_number: int) -> List[str]:
+    """
+    Problems with ONE chapter object (empty list if it is usable).
+    """
+
+    if not isinstance(chapter, dict):
+        return [f"chapter {expected_number} is {type(chapter).__name__}, not an object"]
+
+    problems = []
+    expected_number = _as_int(expected_number) or expected_number
+    number = _as_int(chapter.get("number"))
+    if number is None:
+        problems.append(f"chapter {expected_number} has no valid number")
+    elif number != expected_number:
+        problems.append(
+            f"chapter {expected_number} is mis-numbered as {chapter.get('number')!r}"
+        )
+
+    for field in REQUIRED_CHAPTER_TEXT_FIELDS:
+        value = chapter.get(field)
+        if not isinstance(value, str) or not value.strip():
+            problems.append(f"chapter {expected_number} is missing {field}")
+
+    return problems
+
+
+def find_chapter_problems(
+    outline_chapters: List[Dict[str, Any]],
+    chapters: List[Any],
+) -> Dict[int, List[str]]:
+    """
+    Map outline chapter number -> problems, for every chapter that is
+    missing, mis-numbered or malformed in `chapters`.
+
+    Chapters are matched to the outline by their "number" field; chapters
+    without a usable number are matched by position as a fallback.
+    """
+
+    by_number: Dict[int, Any] = {}
+    unnumbered: List[Any] = []
+    for chapter in chapters:
+        number = _as_int(chapter.get("number")) if isinstance(chapter, dict) else None
+        if number is None or number in by_number:
+            unnumbered.append(chapter)
+        else:
+            by_number[number] = chapter
+
+    problems: Dict[int, List[str]] = {}
+    for index, outline_chapter in enumerate(outline_chapters):
+        expected = _as_int(outline_chapter.get("number"))
+        if expected is None:
+            expected = index + 1
+        chapter = by_number.get(expected)
+        if chapter is None:
+            if index < len(chapters) and chapters[index] in unnumbered:
+                chapter_problems = validate_chapter(chapters[index], expected)
+            else:
+                chapter_problems = [f"chapter {expected} is missing"]
+        else:
+            chapter_problems = validate_chapter(chapter, expected)
+        if chapter_problems:
+            problems[expected] = chapter_problems
+
+    return problems
+
+
+# ---------------------------------------------------------------------
+# Outline validation / auto-repair
+# ---------------------------------------------------------------------
+
+# Hard ceiling from OUTLINE_INSTRUCTION ("NEVER exceed 25 chapters").
+MAX_OUTLINE_CHAPTERS = 25
+
+
+def _title_key(title: str) -> str:
+    return " ".join(title.lower().split()).strip(" .:-–—")
+
+
+class OutlineNormaliser:
+    """
+    Incrementally repair outline chapters against the outline rules:
+
+    - drops entries that are not objects or have no title
+    - drops chapters whose title duplicates an earlier one
+    - renumbers sequentially from 1 in outline order
+    - stops accepting chapters after MAX_OUTLINE_CHAPTERS
+
+    Because every rule only looks at earlier chapters, add() can be called
+    as each chapter streams in and the result is identical to normalising
+    the finished outline in one go.
+    """
+
+    def __init__(self, max_chapters: int = MAX_OUTLINE_CHAPTERS):
+        self.max_chapters = max_chapters
+        self.chapters: List[Dict[str, Any]] = []
+        self.dropped: List[str] = []
+        self._seen_titles: set[str] = set()
+
+    def add(self, chapter: Any) -> Dict[str, Any] | None:
+        """
+        Normalise one chapter; returns it (renumbered) or None if dropped.
+        """
+
+        if not isinstance(chapter, dict):
+            self.dropped.append(f"non-object chapter {chapter!r}")
+            return None
+        title = chapter.get("title")
+        if not isinstance(title, str) or not title.strip():
+            self.dropped.append(f"untitled chapter {chapter.get('number')!r}")
+            return None
+        key = _title_key(title)
+        if key in self._seen_titles:
+            self.dropped.append(f"duplicate title {title!r}")
+            return None
+        if len(self.chapters) >= self.max_chapters:
+            self.dropped.append(f"chapter {title!r} beyond {self.max_chapters}")
+            return None
+
+        self._seen_titles.add(key)
+        normalised = {**chapter, "number": len(self.chapters) + 1, "title": title.strip()}
+        self.chapters.append(normalised)
+        return normalised
+
+
+def required_chapter_count(book_spec: Dict[str, Any]) -> int:
+    """
+    min_chapters from the book spec, clamped to [1, MAX_OUTLINE_CHAPTERS].
+    """
+    value = _as_int(book_spec.get("min_chapters")) or 1
+    return max(1, min(MAX_OUTLINE_CHAPTERS, value))
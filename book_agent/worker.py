@@ -0,0 +1,238 @@
+# book_agent/worker.py
+"""
+Multi-process workers for the book job queue (job_queue.py).
+
+`--processes N` spawns N worker processes. Each has its own event loop and
+runs up to `--concurrency` books at once with generate_book_payload_async,
+leasing jobs from the shared SQLite queue as slots free up. While a book
+is running its lease is renewed every visibility_timeout / 3.
+
+Crash safety:
+  - a crashed or killed worker's leases expire and the jobs are leased
+    again by another worker (up to max_attempts in total)
+  - each job runs under run_id "job-<id>" with checkpointing (see
+    checkpoints.py), so a retried job resumes from its last finished step
+    (share BOOK_BOT_CHECKPOINT_DIR between boxes for cross-box resume);
+    a job's checkpoints are deleted once its result is recorded
+  - results are only recorded by the current lease holder; a worker whose
+    heartbeat finds the lease gone cancels that book at once (counted as
+    "lost"), so two workers do not keep generating and uploading it
+
+BOOK_BOT_RPM / BOOK_BOT_TPM are the budgets of the WHOLE box: each of the
+N worker processes gets 1/N of them. Workers on different boxes each get
+their box's full budget.
+
+Usage:
+    python -m book_agent.job_queue enqueue jobs.db specs.jsonl
+    python -m book_agent.worker jobs.db --processes 4 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+from typing import Dict
+
+from .checkpoints import get_checkpoint_store
+from .job_queue import DEFAULT_MAX_ATTEMPTS, DEFAULT_VISIBILITY_TIMEOUT_S, JobQueue, new_worker_id
+from .rate_limiter import rate_limiter_from_env, set_rate_limiter
+from .storage_backends import get_storage_backend
+from .workflow import DEFAULT_CHAPTER_CONCURRENCY, generate_book_payload_async
+
+DEFAULT_WORKER_CONCURRENCY = 4
+DEFAULT_POLL_INTERVAL_S = 2.0
+
+
+async def _keep_lease(
+    queue: JobQueue, job_id: str, worker_id: str, book: asyncio.Task
+) -> None:
+    while True:
+        await asyncio.sleep(queue.visibility_timeout_s / 3)
+        if not await asyncio.to_thread(queue.heartbeat, job_id, worker_id):
+            # Another worker may own the job now: stop before this one
+            # writes (and uploads) a duplicate book.
+            book.cancel()
+            return
+
+
+async def run_worker_async(
+    queue: JobQueue,
+    worker_id: str,
+    concurrency: int = DEFAULT_WORKER_CONCURRENCY,
+    chapter_concurrency: int = DEFAULT_CHAPTER_CONCURRENCY,
+    poll_interval_s: float = DEFAULT_POLL_INTERVAL_S,
+    exit_when_empty: bool = True,
+) -> Dict[str, int]:
+    """
+    Lease and run jobs until the queue has nothing left to do (or forever,
+    with exit_when_empty=False). Returns {"done", "failed", "lost"}.
+    """
+
+    running: Dict[str, asyncio.Task] = {}
+    stats = {"done": 0, "failed": 0, "lost": 0}
+
+    async def run_job(job: Dict) -> None:
+        job_id = job["id"]
+        run_id = f"job-{job_id}"
+        book = asyncio.create_task(
+            generate_book_payload_async(
+                job["book_spec"],
+                chapter_concurrency=chapter_concurrency,
+                run_id=run_id,
+            )
+        )
+        keeper = asyncio.create_task(_keep_lease(queue, job_id, worker_id, book))
+        try:
+            payload = await book
+        except asyncio.CancelledError:
+            if not keeper.done():
+                raise
+            stats["lost"] += 1  # lease lost; _keep_lease cancelled the book
+        except Exception as e:  # one bad book must not stop the worker
+            recorded = await asyncio.to_thread(queue.fail, job_id, worker_id, repr(e))
+            stats["failed" if recorded else "lost"] += 1
+        else:
+            recorded = await asyncio.to_thread(queue.complete, job_id, worker_id, payload)
+            stats["done" if recorded else "lost"] += 1
+            if recorded:
+                # The result now lives in the queue; the checkpoints would
+                # only pile up (one directory per job).
+                await asyncio.to_thread(get_checkpoint_store().run(run_id).clear)
+        finally:
+            keeper.cancel()
+
+    while True:
+        for job_id in [j for j, task in running.items() if task.done()]:
+            del running[job_id]
+
+        free = max(0, concurrency - len(running))
+        jobs = await asyncio.to_thread(queue.lease, worker_id, free) if free else []
+        for job in jobs:
+            running[job["id"]] = asyncio.create_task(run_job(job))
+
+        if (
+            not jobs
+            and not running
+            and exit_when_empty
+            and not await asyncio.to_thread(queue.has_unfinished)
+        ):
+            break
+
+        if running:
+            await asyncio.wait(
+                running.values(),
+                timeout=poll_interval_s,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        elif not jobs:
+            # Nothing ready yet (retry backoff or another worker's lease).
+            await asyncio.sleep(poll_interval_s)
+
+    # Local backends batch their fsyncs; make the last batch durable.
+    await asyncio.to_thread(get_storage_backend().flush)
+    return stats
+
+
+def _worker_main(
+    queue_path: str,
+    visibility_timeout_s: float,
+    max_attempts: int,
+    journal_mode: str,
+    concurrency: int,
+    chapter_concurrency: int,
+    exit_when_empty: bool,
+    processes: int = 1,
+) -> None:
+    # The configured RPM/TPM quota is shared by every worker process.
+    set_rate_limiter(rate_limiter_from_env(budget_share=1 / max(1, processes)))
+    queue = JobQueue(
+        queue_path,
+        visibility_timeout_s=visibility_timeout_s,
+        max_attempts=max_attempts,
+        journal_mode=journal_mode,
+    )
+    worker_id = new_worker_id()
+    stats = asyncio.run(
+        run_worker_async(
+            queue,
+            worker_id,
+            concurrency=concurrency,
+            chapter_concurrency=chapter_concurrency,
+            exit_when_empty=exit_when_empty,
+        )
+    )
+    print(json.dumps({"worker": worker_id, **stats}), file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run book workers against a job queue.")
+    parser.add_argument("queue_path", help="SQLite job queue file (see job_queue.py)")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="worker processes; they split BOOK_BOT_RPM / BOOK_BOT_TPM evenly",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_WORKER_CONCURRENCY,
+        help="books in flight per worker process",
+    )
+    parser.add_argument(
+        "--chapter-concurrency", type=int, default=DEFAULT_CHAPTER_CONCURRENCY
+    )
+    parser.add_argument(
+        "--visibility-timeout", type=float, default=DEFAULT_VISIBILITY_TIMEOUT_S
+    )
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    parser.add_argument(
+        "--journal-mode",
+        default="WAL",
+        help='SQLite journal mode; use "DELETE" for a queue on a shared filesystem',
+    )
+    parser.add_argument(
+        "--forever",
+        action="store_true",
+        help="keep polling for new jobs instead of exiting when the queue is drained",
+    )
+    args = parser.parse_args()
+
+    # "spawn": every worker starts with a fresh interpreter and event loop
+    # instead of inheriting the parent's ADK/gRPC state through fork().
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=_worker_main,
+            args=(
+                args.queue_path,
+                args.visibility_timeout,
+                args.max_attempts,
+                args.journal_mode,
+                args.concurrency,
+                args.chapter_concurrency,
+                not args.forever,
+                max(1, args.processes),
+            ),
+            name=f"book-worker-{i}",
+        )
+        for i in range(max(1, args.processes))
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Leases of interrupted jobs expire and the jobs are retried.
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+    print(json.dumps(JobQueue(args.queue_path).counts()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
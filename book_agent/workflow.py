@@ -2,47 +2,115 @@
 """
 Deterministic end-to-end book generator using ADK InMemoryRunner.
 
+Runners are pooled per agent (see runner_pool.py) and reused across steps
+and books; each agent run gets its own short-lived session.
+
 Pipeline:
   1) outline_agent  -> outline JSON
-  2) manuscript_agent -> manuscript JSON
-  3) gcs_save_agent -> GCS URIs
+  2) front_matter_agent + one chapter_agent per outline chapter
+     (run concurrently) -> merged manuscript JSON
+  3) save_book_to_gcs_async (direct tool step, no LLM, uploads run
+     concurrently off the event loop) -> GCS URIs
   4) Assemble final book payload JSON
+
+generate_book_events_async streams the run as typed events (outline
+ready, each chapter as it completes, storage done, final payload; see
+book_events.py); generate_book_payload_async returns just the payload.
+
+Every agent and tool step is recorded in a per-run tracing.RunTrace
+(wall time, TTFT, token usage, tool-call and JSON-cleanup timings).
+
+Each agent step can run on a model chosen per step and per chapter (opt-in,
+see model_routing.py); the choice is recorded on the trace.
+
+The chapters' shared prompt prefix can be served from per-book Gemini
+context caching (opt-in, see prompt_cache.py).
+
+Slow chapter requests can be hedged with a duplicate request (opt-in,
+see hedging.py).
+
+Runs given a run_id are checkpointed step by step (see checkpoints.py);
+re-running with the same run_id resumes from the first missing step.
 """
 
+import asyncio
+import inspect
 import json
-from typing import Any, Dict
+import random
+import time
+from contextlib import aclosing, nullcontext
+from typing import Any, AsyncIterator, Callable, Dict, List, Sequence
 
-from google.adk.runners import InMemoryRunner
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.genai import types
 
-from .custom_agents import outline_agent, manuscript_agent, gcs_save_agent
+from .assembler import assemble_book_markdown
+from .book_events import BookComplete, BookEvent, ChapterComplete, OutlineReady, StorageDone
+from .checkpoints import RunCheckpoint, chapter_checkpoint_key, get_checkpoint_store
+from .custom_agents import get_agent
+from .hedging import get_chapter_hedger
+from .json_utils import IncrementalArrayParser, parse_json_object
+from .llm_cache import LLMResponseCache, get_default_cache, make_cache_key
+from .model_routing import get_model_router
+from .prompt_cache import get_current_prompt_cache, prompt_cache_from_env, use_prompt_cache
+from .rate_limiter import get_rate_limiter
+from .validation import (
+    OutlineNormaliser,
+    find_chapter_problems,
+    required_chapter_count,
+    validate_chapter,
+)
+from .runner_pool import RunnerPool
+from .tools import (
+    STORAGE_GZIP,
+    STORAGE_LAYOUT,
+    STORE_MANUSCRIPT,
+    save_book_chapters_async,
+    save_book_to_gcs_async,
+)
+from .tracing import RunTrace, StepTrace, get_current_trace, use_trace
 
 APP_NAME = "adk-book-bot-local"
 
+# Maximum number of chapter_agent calls in flight at once for one book.
+DEFAULT_CHAPTER_CONCURRENCY = 4
 
-async def _run_json_agent_async(
+# Stream the outline and start writing each chapter as soon as its outline
+# entry has been parsed, instead of waiting for the whole outline.
+DEFAULT_STREAM_OUTLINE = True
+
+# A chapter whose output is non-JSON, mis-numbered or malformed is
+# re-requested on its own, up to this many attempts in total, with
+# exponential backoff starting at CHAPTER_RETRY_BASE_DELAY_S.
+DEFAULT_CHAPTER_ATTEMPTS = 3
+CHAPTER_RETRY_BASE_DELAY_S = 2.0
+
+# Targeted outline_topup_agent requests allowed when the repaired outline
+# still has fewer than min_chapters chapters.
+OUTLINE_TOPUP_ATTEMPTS = 2
+
+# Process-wide runner pool shared by every book generated in this process.
+_runner_pool = RunnerPool(APP_NAME)
+
+
+async def _run_agent_text_async(
     agent,
     input_obj: Dict[str, Any],
     user_id: str,
     session_id: str,
-) -> Dict[str, Any]:
+    pool: RunnerPool,
+    parser: IncrementalArrayParser | None,
+    on_array_item: Callable[[Dict[str, Any], Dict[str, Any]], None] | None,
+    step: StepTrace | None = None,
+) -> str:
     """
-    Run a single agent turn with JSON-in / JSON-out via InMemoryRunner.
-
-    - Serialises input_obj to JSON text.
-    - Sends it as one user message.
-    - Waits for final response, parses JSON, returns dict.
+    Send input_obj to `agent` in a fresh pooled session; return the final
+    response text. Partial output is fed to `parser` when one is given,
+    and every event to `step` (TTFT, usage, tool calls) when one is given.
     """
 
-    # InMemoryRunner builds its own InMemorySessionService internally
-    runner = InMemoryRunner(agent=agent, app_name=APP_NAME)
-    session_service = runner.session_service
-
-    # Create a fresh session for this agent run
-    await session_service.create_session(
-        app_name=APP_NAME,
-        user_id=user_id,
-        session_id=session_id,
+    run_config = RunConfig(
+        streaming_mode=StreamingMode.SSE if parser else StreamingMode.NONE
     )
 
     user_content = types.Content(
@@ -52,102 +120,717 @@ async def _run_json_agent_async(
 
     final_text: str | None = None
 
-    async for event in runner.run_async(
-        user_id=user_id,
-        session_id=session_id,
-        new_message=user_content,
-    ):
-        if event.is_final_response() and event.content and event.content.parts:
-            final_text = event.content.parts[0].text
+    async with pool.session(agent, user_id, session_id) as (runner, run_session_id):
+        async for event in runner.run_async(
+            user_id=user_id,
+            session_id=run_session_id,
+            new_message=user_content,
+            run_config=run_config,
+        ):
+            if step:
+                step.on_event(event)
+            if parser and event.partial and event.content and event.content.parts:
+                for part in event.content.parts:
+                    if part.text and not part.thought:
+                        for item in parser.feed(part.text):
+                            if on_array_item:
+                                on_array_item(item, parser.header)
+            if event.is_final_response() and event.content and event.content.parts:
+                final_text = event.content.parts[0].text
 
     if not final_text:
         raise RuntimeError(f"No final response from agent {agent.name}")
 
-    # --- Clean up any markdown fences / extra text before parsing JSON ---
-    text = final_text.strip()
-
-    # Strip ```json ... ``` or ``` ... ``` fences if present
-    if text.startswith("```"):
-        lines = text.splitlines()
-        if len(lines) > 1:
-            # drop first line (``` or ```json)
-            lines = lines[1:]
-        if lines and lines[-1].strip().startswith("```"):
-            # drop last line (```)
-            lines = lines[:-1]
-        text = "\n".join(lines).strip()
-
-    # Use JSONDecoder.raw_decode to parse the FIRST JSON object only
-    try:
-        decoder = json.JSONDecoder()
-        obj, _ = decoder.raw_decode(text.lstrip())
-        return obj
-    except json.JSONDecodeError as e:
-        raise RuntimeError(
-            f"Agent {agent.name} returned non-JSON even after cleaning:\n{text}"
-        ) from e
+    return final_text
 
 
+async def _run_json_agent_async(
+    agent,
+    input_obj: Dict[str, Any],
+    user_id: str,
+    session_id: str,
+    runner_pool: RunnerPool | None = None,
+    stream_array_key: str | None = None,
+    on_array_item: Callable[[Dict[str, Any], Dict[str, Any]], None] | None = None,
+    cache: LLMResponseCache | None = None,
+    use_rate_limit_slot: bool = True,
+    cache_read: bool = True,
+    route_step: str | None = None,
+    route_chapter: Dict[str, Any] | None = None,
+    route_elapsed_s: float = 0.0,
+    cache_input: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    """
+    Run a single agent turn with JSON-in / JSON-out via a pooled runner.
+
+    - Serialises input_obj to JSON text.
+    - Sends it as one user message in a fresh session whose ID starts
+      with `session_id` (a unique suffix is added per run).
+    - Waits for final response, parses JSON, returns dict.
+    - Deletes the session afterwards.
 
+    Streaming mode (stream_array_key set):
+    - Requests partial (SSE) model output and parses the top-level array
+      `stream_array_key` incrementally.
+    - Calls on_array_item(item, header) as soon as each array item is
+      complete; `header` holds the top-level string fields parsed so far.
+    - Items the stream did not deliver are passed to on_array_item after
+      the final parse, so every item is reported exactly once.
 
-async def generate_book_payload_async(book_spec: Dict[str, Any]) -> Dict[str, Any]:
+    Caching:
+    - If `cache` (or the process default from llm_cache) is configured,
+      a hit skips the model entirely and a miss stores the parsed result.
+    - cache_read=False forces a fresh call (used when re-requesting output
+      that failed validation) but still overwrites the cached entry.
+    - cache_input, if given, is keyed instead of input_obj (for inputs
+      with fields that vary between otherwise identical runs).
+
+    Rate limiting:
+    - The model call runs inside a slot of the shared AdaptiveRateLimiter
+      and is retried with backoff on 429 / RESOURCE_EXHAUSTED errors.
+    - Pass use_rate_limit_slot=False for calls made from inside another
+      agent's tool (they already run under that agent's slot).
+
+    Tracing:
+    - If a RunTrace is active (tracing.use_trace), the call is recorded as
+      one step named after the agent, including JSON-cleanup time.
+
+    Model routing:
+    - If a ModelRouter is configured (model_routing.py) and `route_step`
+      is given, the agent runs on the model the router picks for that step
+      (and `route_chapter`, with `route_elapsed_s` already spent on it);
+      the choice is recorded on the trace step and the call's latency is
+      fed back to the router.
     """
-    End-to-end workflow (async):
 
-      1) outline_agent -> outline JSON
-      2) manuscript_agent -> manuscript JSON
-      3) gcs_save_agent -> GCS URIs
-      4) Assemble final book payload JSON
+    router = get_model_router() if route_step else None
+    route = router.choose(route_step, route_chapter, route_elapsed_s) if router else None
+    if route:
+        agent = router.route_agent(agent, route["model"])
+
+    pool = runner_pool or _runner_pool
+    parser = IncrementalArrayParser(stream_array_key) if stream_array_key else None
+    cache = cache if cache is not None else get_default_cache()
+    cache_key = (
+        make_cache_key(agent, input_obj if cache_input is None else cache_input)
+        if cache
+        else None
+    )
+
+    trace = get_current_trace()
+    step_scope = (
+        trace.step(agent.name, kind="agent", session=session_id)
+        if trace
+        else nullcontext(None)
+    )
+
+    with step_scope as step:
+        # Disk I/O off the event loop, which other chapters share.
+        obj = (
+            await asyncio.to_thread(cache.get, cache_key)
+            if cache and cache_read
+            else None
+        )
+        if step:
+            step.attrs["cache_hit"] = obj is not None
+            if route:
+                step.attrs["model"] = route["model"]
+                step.attrs["route_reason"] = route["reason"]
+        if obj is None:
+            def call():
+                if parser:
+                    # A retried stream replays from the start; don't re-report.
+                    parser.reset()
+                return _run_agent_text_async(
+                    agent,
+                    input_obj,
+                    user_id,
+                    session_id,
+                    pool=pool,
+                    parser=parser,
+                    on_array_item=on_array_item,
+                    step=step,
+                )
+
+            started = time.perf_counter()
+            final_text = await get_rate_limiter().run(call, use_slot=use_rate_limit_slot)
+            if route:
+                router.record_latency(
+                    route_step, route["model"], time.perf_counter() - started
+                )
+            with step.time_json_cleanup() if step else nullcontext():
+                obj = parse_json_object(final_text, agent.name)
+            if cache:
+                await asyncio.to_thread(cache.put, cache_key, obj)
+
+    if parser and on_array_item:
+        items = obj.get(stream_array_key) or []
+        for item in items[parser.items_emitted:]:
+            on_array_item(item, obj)
+
+    return obj
+
+
+async def _run_direct_tool_async(
+    tool_func: Callable[..., Any],
+    input_obj: Dict[str, Any],
+    required_keys: Sequence[str] = (),
+) -> Dict[str, Any]:
+    """
+    Run a deterministic tool step WITHOUT an LLM in the loop.
+
+    - Calls the plain Python implementation behind an ADK FunctionTool
+      with input_obj as keyword arguments.
+    - Awaits async implementations directly; runs sync ones in a worker
+      thread so blocking I/O does not stall the loop.
+    - Checks the result carries `required_keys` (same contract the
+      equivalent LLM agent step promised), returns dict.
+    - Records the call as a tool step in the active RunTrace, if any.
+    """
+
+    async def call() -> Any:
+        if inspect.iscoroutinefunction(tool_func):
+            return await tool_func(**input_obj)
+        return await asyncio.to_thread(tool_func, **input_obj)
+
+    trace = get_current_trace()
+    if trace is None:
+        result = await call()
+    else:
+        with trace.step(tool_func.__name__, kind="tool") as step:
+            started = time.perf_counter()
+            result = await call()
+            step.record_tool_call(tool_func.__name__, time.perf_counter() - started)
+
+    if not isinstance(result, dict):
+        raise RuntimeError(
+            f"Tool {tool_func.__name__} returned {type(result).__name__}, expected dict"
+        )
+    missing = [k for k in required_keys if not result.get(k)]
+    if missing:
+        raise RuntimeError(
+            f"Tool {tool_func.__name__} result is missing {missing}. "
+            f"Keys: {list(result.keys())}"
+        )
+    return result
+
+
+# ---------------------------------------------------------------------
+# Outline step
+# ---------------------------------------------------------------------
+
+async def _generate_outline_async(
+    book_spec: Dict[str, Any],
+    stream_outline: bool,
+    on_chapter: Callable[[Dict[str, Any], Dict[str, Any]], None],
+) -> Dict[str, Any]:
     """
+    Run outline_agent, then validate and repair the outline locally:
+
+    - every chapter goes through validation.OutlineNormaliser (renumbered,
+      de-duplicated by title, clamped to 25) as soon as it is available;
+    - on_chapter(chapter, partial_outline) is called once per ACCEPTED
+      chapter, so callers can start writing it immediately;
+    - if fewer than min_chapters remain, outline_topup_agent is asked for
+      just the missing chapters (up to OUTLINE_TOPUP_ATTEMPTS times).
+    """
+
+    min_chapters = required_chapter_count(book_spec)
+    normaliser = OutlineNormaliser()
+    header: Dict[str, Any] = {}
+
+    def accept(raw_chapter: Dict[str, Any], outline_fields: Dict[str, Any]) -> None:
+        header.update(
+            {k: v for k, v in outline_fields.items() if isinstance(v, str)}
+        )
+        chapter = normaliser.add(raw_chapter)
+        if chapter is not None:
+            on_chapter(chapter, {**header, "chapters": list(normaliser.chapters)})
 
-    # --- STEP 1: Outline ---
     outline = await _run_json_agent_async(
-        outline_agent,
+        get_agent("outline_agent"),
         input_obj=book_spec,
         user_id="outline-user",
         session_id="outline-session",
+        stream_array_key="chapters" if stream_outline else None,
+        on_array_item=accept if stream_outline else None,
+        route_step="outline",
     )
+    if not stream_outline:
+        for raw_chapter in outline.get("chapters") or []:
+            accept(raw_chapter, outline)
+
+    for attempt in range(OUTLINE_TOPUP_ATTEMPTS):
+        shortfall = min_chapters - len(normaliser.chapters)
+        if shortfall <= 0:
+            break
+        topup = await _run_json_agent_async(
+            get_agent("outline_topup_agent"),
+            input_obj={
+                "book_spec": book_spec,
+                "working_title": outline.get("working_title", ""),
+                "existing_chapters": normaliser.chapters,
+                "chapters_needed": shortfall,
+            },
+            user_id="outline-user",
+            session_id="outline-topup-session",
+            cache_read=attempt == 0,
+            route_step="outline_topup",
+        )
+        for raw_chapter in topup.get("chapters") or []:
+            accept(raw_chapter, outline)
+
+    if len(normaliser.chapters) < min_chapters:
+        raise RuntimeError(
+            f"Outline has {len(normaliser.chapters)} usable chapters, "
+            f"min_chapters is {min_chapters}. Dropped: {normaliser.dropped}"
+        )
+
+    return {**outline, "chapters": normaliser.chapters}
+
+
+# ---------------------------------------------------------------------
+# Manuscript fan-out helpers
+# ---------------------------------------------------------------------
+
+async def _write_chapter_async(
+    outline_chapter: Dict[str, Any],
+    outline: Dict[str, Any],
+    book_spec: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+    max_attempts: int = DEFAULT_CHAPTER_ATTEMPTS,
+    checkpoint: RunCheckpoint | None = None,
+    on_chapter: Callable[[Dict[str, Any]], None] | None = None,
+) -> Dict[str, Any]:
+    """
+    Write ONE outline chapter with chapter_agent, bounded by `semaphore`.
+
+    `outline` may be a partial outline (header fields + the chapters parsed
+    so far) when the chapter was dispatched while the outline streamed.
+
+    Output that is non-JSON, mis-numbered or malformed (see
+    validation.validate_chapter) is re-requested for THIS chapter only, up
+    to `max_attempts` times with exponential backoff; the semaphore is not
+    held while backing off.
 
-    # --- STEP 2: Manuscript ---
-    manuscript_input = {
-        "outline": outline,
+    With a `checkpoint`, a chapter already written for this outline entry
+    is returned as-is, and a newly written one is saved.
+
+    If a chapter hedger is configured (see hedging.py), a slow attempt gets
+    a duplicate request and the first valid chapter wins.
+
+    on_chapter(chapter) is called once the chapter is ready (written or
+    loaded from the checkpoint).
+    """
+
+    number = outline_chapter.get("number")
+    checkpoint_key = chapter_checkpoint_key(outline_chapter)
+    if checkpoint:
+        saved = checkpoint.load(checkpoint_key)
+        if saved is not None:
+            if on_chapter:
+                on_chapter(saved)
+            return saved
+
+    chapter_input = {
         "book_spec": book_spec,
+        "working_title": outline.get("working_title", ""),
+        "subtitle": outline.get("subtitle", ""),
+        "notes_for_writer": outline.get("notes_for_writer", ""),
+        "outline_titles": [c.get("title", "") for c in outline.get("chapters") or []],
+        "chapter": outline_chapter,
     }
 
-    manuscript = await _run_json_agent_async(
-        manuscript_agent,
-        input_obj=manuscript_input,
-        user_id="manuscript-user",
-        session_id="manuscript-session",
+    started = time.perf_counter()
+
+    async def request_chapter(session: str, cache_read: bool) -> Dict[str, Any]:
+        chapter = await _run_json_agent_async(
+            get_agent("chapter_agent"),
+            input_obj=chapter_input,
+            user_id="chapter-user",
+            session_id=f"chapter-{number}-{session}",
+            cache_read=cache_read,
+            route_step="chapter",
+            route_chapter=outline_chapter,
+            # Retries and hedges count against the chapter's latency budget.
+            route_elapsed_s=time.perf_counter() - started,
+            # The outline header fields and titles depend on how far the
+            # outline had streamed when this chapter started; a re-run
+            # (outline from cache, complete) must still hit.
+            cache_input={"book_spec": book_spec, "chapter": outline_chapter},
+        )
+        problems = validate_chapter(chapter, number)
+        if problems:
+            raise RuntimeError("; ".join(problems))
+        return chapter
+
+    hedger = get_chapter_hedger()
+    last_problem = ""
+    for attempt in range(1, max_attempts + 1):
+        # A cached answer is what failed; don't serve it again.
+        cache_read = attempt == 1
+        try:
+            async with semaphore:
+                if hedger:
+                    chapter = await hedger.run(
+                        lambda: request_chapter("session", cache_read),
+                        lambda: request_chapter("hedge-session", cache_read),
+                    )
+                else:
+                    chapter = await request_chapter("session", cache_read)
+        except RuntimeError as e:  # no final response / non-JSON / invalid
+            last_problem = str(e)
+        else:
+            chapter["number"] = number
+            if checkpoint:
+                checkpoint.save(checkpoint_key, chapter)
+            if on_chapter:
+                on_chapter(chapter)
+            return chapter
+
+        if attempt < max_attempts:
+            delay = CHAPTER_RETRY_BASE_DELAY_S * (2 ** (attempt - 1))
+            await asyncio.sleep(delay * (0.5 + random.random()))
+
+    raise RuntimeError(
+        f"Chapter {number} failed after {max_attempts} attempts: {last_problem}"
+    )
+
+
+async def _write_manuscript_async(
+    outline: Dict[str, Any],
+    book_spec: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+    chapter_tasks: Dict[Any, asyncio.Task],
+    checkpoint: RunCheckpoint | None = None,
+    on_chapter: Callable[[Dict[str, Any]], None] | None = None,
+) -> Dict[str, Any]:
+    """
+    Fan the manuscript step out into one chapter_agent task per outline
+    chapter (plus one front_matter_agent task), then merge everything back
+    into the manuscript JSON shape that manuscript_agent used to return.
+
+    `chapter_tasks` maps chapter number -> task for chapters that were
+    already dispatched while the outline streamed; only the rest are
+    started here.
+
+    With a `checkpoint`, finished chapters and front matter are reused.
+    on_chapter is passed to every chapter started here.
+    """
+
+    outline_chapters = outline.get("chapters") or []
+    if not isinstance(outline_chapters, list) or not outline_chapters:
+        raise RuntimeError(
+            f"outline_agent returned no chapters. Keys: {list(outline.keys())}"
+        )
+
+    for c in outline_chapters:
+        if c.get("number") not in chapter_tasks:
+            chapter_tasks[c.get("number")] = asyncio.create_task(
+                _write_chapter_async(
+                    c,
+                    outline,
+                    book_spec,
+                    semaphore,
+                    checkpoint=checkpoint,
+                    on_chapter=on_chapter,
+                )
+            )
+
+    async def write_front_matter() -> Dict[str, Any]:
+        front_matter = checkpoint.load("front_matter") if checkpoint else None
+        if front_matter is None:
+            front_matter = await _run_json_agent_async(
+                get_agent("front_matter_agent"),
+                input_obj={"outline": outline, "book_spec": book_spec},
+                user_id="front-matter-user",
+                session_id="front-matter-session",
+                route_step="front_matter",
+            )
+            if checkpoint:
+                checkpoint.save("front_matter", front_matter)
+        return front_matter
+
+    front_matter, *chapters = await asyncio.gather(
+        write_front_matter(),
+        *(chapter_tasks[c.get("number")] for c in outline_chapters),
     )
 
+    problems = find_chapter_problems(outline_chapters, chapters)
+    if problems:
+        raise RuntimeError(f"Manuscript chapters failed validation: {problems}")
+
+    chapters.sort(key=lambda c: c.get("number") or 0)
+    working_title = front_matter.get("working_title") or outline.get("working_title", "")
+    subtitle = front_matter.get("subtitle") or outline.get("subtitle", "")
+    front_matter_markdown = front_matter.get("front_matter_markdown", {})
+
+    return {
+        "working_title": working_title,
+        "subtitle": subtitle,
+        "blurb": front_matter.get("blurb", ""),
+        "front_matter_markdown": front_matter_markdown,
+        "chapters": chapters,
+        # Assembled locally from the chapter objects; never model-generated.
+        "full_book_markdown": assemble_book_markdown(
+            book_spec,
+            working_title=working_title,
+            subtitle=subtitle,
+            front_matter_markdown=front_matter_markdown,
+            chapters=chapters,
+        ),
+    }
+
+
+async def generate_book_payload_async(
+    book_spec: Dict[str, Any],
+    chapter_concurrency: int = DEFAULT_CHAPTER_CONCURRENCY,
+    stream_outline: bool = DEFAULT_STREAM_OUTLINE,
+    include_trace: bool = False,
+    trace_path: str | None = None,
+    run_id: str | None = None,
+) -> Dict[str, Any]:
+    """
+    End-to-end workflow (async):
+
+      1) outline_agent -> outline JSON, validated/repaired locally
+         (streamed: each chapter is dispatched as soon as it is parsed)
+      2) front_matter_agent + chapter_agent per chapter -> manuscript JSON
+         (at most `chapter_concurrency` chapters are written at once)
+      3) save_book_to_gcs_async (direct tool step) -> GCS URIs
+      4) Assemble final book payload JSON
+
+    The run is traced (see tracing.py). include_trace=True adds the trace
+    to the payload as "run_trace"; trace_path writes it there as JSON
+    (also on failure).
+
+    With a run_id, each finished step is checkpointed in the default
+    CheckpointStore and a re-run with the same run_id (and the same
+    book_spec) skips it.
+
+    Returns only once the book is done; generate_book_events_async streams
+    the same run as it progresses.
+    """
+
+    # aclosing: run the stream's cleanup (trace file, prompt caches) now,
+    # not whenever the abandoned generator is garbage-collected.
+    async with aclosing(
+        generate_book_events_async(
+            book_spec,
+            chapter_concurrency=chapter_concurrency,
+            stream_outline=stream_outline,
+            include_trace=include_trace,
+            trace_path=trace_path,
+            run_id=run_id,
+        )
+    ) as events:
+        async for event in events:
+            if isinstance(event, BookComplete):
+                return event.payload
+    raise RuntimeError("Book event stream ended without a final payload")
+
+
+async def generate_book_events_async(
+    book_spec: Dict[str, Any],
+    chapter_concurrency: int = DEFAULT_CHAPTER_CONCURRENCY,
+    stream_outline: bool = DEFAULT_STREAM_OUTLINE,
+    include_trace: bool = False,
+    trace_path: str | None = None,
+    run_id: str | None = None,
+) -> AsyncIterator[BookEvent]:
+    """
+    Same run as generate_book_payload_async, as an async generator of
+    typed events (see book_events.py):
+
+      OutlineReady -> ChapterComplete per chapter (completion order)
+      -> StorageDone -> BookComplete(payload)
+
+    so callers can show progress or forward chapter 1 while later chapters
+    are still being written. The book runs in its own task; closing the
+    generator early cancels it (and its chapter writers). A failure is
+    raised from the generator after the events that preceded it.
+
+    With BOOK_BOT_PROMPT_CACHE=1 the chapters' shared prompt prefix
+    (including the complete outline) is served from Gemini cached content
+    that lives for this book only (see prompt_cache.py); chapters then
+    start once the outline is complete instead of while it streams.
+    """
+
+    checkpoint = get_checkpoint_store().run(run_id, book_spec) if run_id else None
+    trace = RunTrace(run_id=run_id)
+    events: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def produce() -> None:
+        try:
+            await _generate_book_payload_async(
+                book_spec,
+                chapter_concurrency,
+                stream_outline,
+                checkpoint,
+                emit=events.put_nowait,
+            )
+        finally:
+            events.put_nowait(done)
+
+    prefix_cache = prompt_cache_from_env()
+
+    # The task copies the context, so everything it runs sees the trace
+    # (and the book's prompt prefix cache).
+    with use_trace(trace), use_prompt_cache(prefix_cache):
+        producer = asyncio.create_task(produce())
+
+    try:
+        while True:
+            event = await events.get()
+            if event is done:
+                break
+            if isinstance(event, BookComplete):
+                trace.finish()
+                if include_trace:
+                    event.payload["run_trace"] = trace.to_dict()
+            yield event
+        # Re-raise the book's failure, if any.
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+        if prefix_cache:
+            await prefix_cache.cleanup()
+        if trace.wall_s is None:
+            trace.finish()
+        if trace_path:
+            trace.write_json(trace_path)
+
+
+async def _generate_book_payload_async(
+    book_spec: Dict[str, Any],
+    chapter_concurrency: int,
+    stream_outline: bool,
+    checkpoint: RunCheckpoint | None,
+    emit: Callable[[BookEvent], None],
+) -> None:
+    """
+    Run one book, passing each BookEvent to `emit` as it happens.
+
+    ChapterComplete events for chapters that finish while the outline is
+    still streaming are held back until OutlineReady has been emitted.
+    """
+    semaphore = asyncio.Semaphore(max(1, chapter_concurrency))
+    chapter_tasks: Dict[Any, asyncio.Task] = {}
+    prefix_cache = get_current_prompt_cache()
+    early_chapters: List[Dict[str, Any]] | None = []
+
+    def on_chapter(chapter: Dict[str, Any]) -> None:
+        if early_chapters is None:
+            emit(ChapterComplete(chapter))
+        else:
+            early_chapters.append(chapter)
+
+    def dispatch_chapter(
+        outline_chapter: Dict[str, Any], partial_outline: Dict[str, Any]
+    ) -> None:
+        if prefix_cache:
+            # The cached prefix holds the complete outline, so chapters are
+            # left to _write_manuscript_async, which passes that outline.
+            return
+        chapter_tasks[outline_chapter["number"]] = asyncio.create_task(
+            _write_chapter_async(
+                outline_chapter,
+                partial_outline,
+                book_spec,
+                semaphore,
+                checkpoint=checkpoint,
+                on_chapter=on_chapter,
+            )
+        )
+
+    try:
+        # --- STEP 1: Outline (chapters dispatched as they are accepted) ---
+        outline = checkpoint.load("outline") if checkpoint else None
+        if outline is None:
+            outline = await _generate_outline_async(
+                book_spec,
+                stream_outline=stream_outline,
+                on_chapter=dispatch_chapter,
+            )
+            if checkpoint:
+                checkpoint.save("outline", outline)
+        if prefix_cache:
+            prefix_cache.set_outline(outline)
+        emit(OutlineReady(outline))
+        for chapter in early_chapters:
+            emit(ChapterComplete(chapter))
+        early_chapters = None
+
+        # --- STEP 2: Manuscript (one task per chapter) ---
+        manuscript = await _write_manuscript_async(
+            outline,
+            book_spec,
+            semaphore=semaphore,
+            chapter_tasks=chapter_tasks,
+            checkpoint=checkpoint,
+            on_chapter=on_chapter,
+        )
+    except BaseException:
+        # Don't leave chapter writers running for a book that has failed.
+        for task in chapter_tasks.values():
+            task.cancel()
+        raise
+
     chapters = manuscript.get("chapters") or []
     if not isinstance(chapters, list) or not chapters:
         raise RuntimeError(
-            f"manuscript_agent returned no chapters. Keys: {list(manuscript.keys())}"
+            f"chapter fan-out returned no chapters. Keys: {list(manuscript.keys())}"
         )
 
     # --- STEP 3: Save to GCS ---
-    gcs_input = {
+    metadata = {
         "working_title": manuscript["working_title"],
-        "full_book_markdown": manuscript["full_book_markdown"],
-        "metadata": {
-            "working_title": manuscript["working_title"],
-            "subtitle": manuscript.get("subtitle", ""),
-            "chapter_count": len(chapters),
-            "blurb": manuscript.get("blurb", ""),
-            "target_audience": book_spec.get("target_audience", ""),
-        },
+        "subtitle": manuscript.get("subtitle", ""),
+        "chapter_count": len(chapters),
+        "blurb": manuscript.get("blurb", ""),
+        "target_audience": book_spec.get("target_audience", ""),
     }
+    if STORAGE_LAYOUT == "chapters":
+        storage_tool = save_book_chapters_async
+        gcs_input = {
+            "working_title": manuscript["working_title"],
+            "chapters": chapters,
+            "metadata": metadata,
+            "front_matter_markdown": manuscript.get("front_matter_markdown", {}),
+            "full_book_markdown": (
+                manuscript["full_book_markdown"] if STORE_MANUSCRIPT else None
+            ),
+            "gzip_chapters": STORAGE_GZIP,
+        }
+        required_keys = ("manifest_gcs_uri", "metadata_gcs_uri")
+    else:
+        storage_tool = save_book_to_gcs_async
+        gcs_input = {
+            "working_title": manuscript["working_title"],
+            "full_book_markdown": manuscript["full_book_markdown"],
+            "metadata": metadata,
+        }
+        required_keys = ("manuscript_gcs_uri", "metadata_gcs_uri")
 
-    gcs_result = await _run_json_agent_async(
-        gcs_save_agent,
-        input_obj=gcs_input,
-        user_id="gcs-user",
-        session_id="gcs-session",
-    )
+    # Direct tool call: the manuscript never round-trips through a model.
+    gcs_result = checkpoint.load("storage") if checkpoint else None
+    if gcs_result is None:
+        gcs_result = await _run_direct_tool_async(
+            storage_tool,
+            input_obj=gcs_input,
+            required_keys=required_keys,
+        )
+        if checkpoint:
+            checkpoint.save("storage", gcs_result)
+    emit(StorageDone(gcs_result))
 
-    manuscript_gcs_uri = gcs_result["manuscript_gcs_uri"]
+    # Per-chapter layout without a manuscript object: point at the manifest.
+    manuscript_gcs_uri = (
+        gcs_result.get("manuscript_gcs_uri") or gcs_result["manifest_gcs_uri"]
+    )
     metadata_gcs_uri = gcs_result["metadata_gcs_uri"]
 
     # --- STEP 4: Final combined payload ---
@@ -175,4 +858,7 @@ async def generate_book_payload_async(book_spec: Dict[str, Any]) -> Dict[str, An
         },
     }
 
-    return final_payload
+    if gcs_result.get("manifest_gcs_uri"):
+        final_payload["storage_uris"]["manifest_gcs_uri"] = gcs_result["manifest_gcs_uri"]
+
+    emit(BookComplete(final_payload))